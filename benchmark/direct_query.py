@@ -0,0 +1,78 @@
+"""
+Compare reading chat records through the container, which sends a
+`record:query` action to Skygear, against reading them directly from the
+database.
+
+The container path needs a running Skygear server for the benchmark app,
+configured by the usual SKYGEAR_ENDPOINT, API_KEY and MASTER_KEY
+variables. When it cannot be reached only the direct path is measured.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres \
+        python -m benchmark.direct_query
+"""
+from chat.database import Database
+from chat.predicate import Predicate
+from chat.query import Query
+from chat.utils import _get_container
+from skygear.utils.context import start_context
+
+from . import fixtures
+
+MESSAGE_COUNTS = [1, 50, 500]
+PARTICIPANT_COUNT = 20
+
+
+def fetch_messages(conversation_id, limit, direct):
+    database = Database(_get_container(), '_public')
+    query = Query('message',
+                  predicate=Predicate(conversation__eq=conversation_id),
+                  limit=limit,
+                  direct=direct).add_order('_created_at', 'desc')
+    return database.query(query)
+
+
+def fetch_user_conversations(conversation_id, direct):
+    database = Database(_get_container(), '_public')
+    query = Query('user_conversation',
+                  predicate=Predicate(conversation__eq=conversation_id),
+                  limit=None,
+                  include=['conversation', 'user'],
+                  direct=direct)
+    return database.query(query)
+
+
+def time_or_none(fn, *args):
+    try:
+        return '%10.2fms' % fixtures.timed(fn, *args)
+    except Exception:
+        return '%12s' % 'n/a'
+
+
+def main():
+    fixtures.setup()
+    fixtures.create_schema()
+    try:
+        users = ['user%d' % i for i in range(PARTICIPANT_COUNT)]
+        print('%-24s %12s %12s' % ('query', 'container', 'direct'))
+        with start_context({'user_id': users[0]}):
+            for count in MESSAGE_COUNTS:
+                conversation_id, _ = \
+                    fixtures.create_conversation(users, count)
+                print('%-24s %s %s' % (
+                    '%d messages' % count,
+                    time_or_none(fetch_messages, conversation_id, count,
+                                 False),
+                    time_or_none(fetch_messages, conversation_id, count,
+                                 True)))
+            print('%-24s %s %s' % (
+                '%d user conversations' % PARTICIPANT_COUNT,
+                time_or_none(fetch_user_conversations, conversation_id,
+                             False),
+                time_or_none(fetch_user_conversations, conversation_id,
+                             True)))
+    finally:
+        fixtures.drop_schema()
+
+
+if __name__ == '__main__':
+    main()
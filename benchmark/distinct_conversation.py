@@ -0,0 +1,81 @@
+"""
+Compare the duplicate check of distinct conversation creation by
+participant fingerprint against the previous implementation, which
+grouped the user_conversation rows of every conversation of the
+participants.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres \
+        python -m benchmark.distinct_conversation
+"""
+from psycopg2.extensions import AsIs
+
+from chat.conversation_handlers import __validate_conversation
+from chat.exc import ConversationAlreadyExistsException
+from chat.utils import _get_schema_name
+from skygear.utils import db
+
+from . import fixtures
+
+CONVERSATION_COUNTS = [10, 1000, 5000]
+PARTICIPANT_COUNT = 4
+
+
+def grouping_validate_conversation(participants):
+    with db.conn() as conn:
+        result = conn.execute("""
+            SELECT c._id
+                FROM %(schema_name)s.conversation AS c
+            WHERE c._id IN (
+                SELECT uc.conversation
+                FROM %(schema_name)s.user_conversation AS uc
+                WHERE uc.conversation IN (
+                    SELECT uc.conversation
+                    FROM %(schema_name)s.user_conversation
+                    AS uc
+                    WHERE uc.user IN %(user_ids)s
+                    GROUP BY uc.conversation
+                    HAVING
+                        COUNT(DISTINCT uc.user) = %(count)s)
+                GROUP BY uc.conversation
+                HAVING COUNT(DISTINCT uc.user) = %(count)s)
+            ORDER BY c._created_at DESC
+            """, {'schema_name': AsIs(_get_schema_name()),
+                  'user_ids': tuple(participants),
+                  'count': len(participants)})
+        return result.first()
+
+
+def fingerprint_validate_conversation(participants):
+    try:
+        __validate_conversation(participants)
+    except ConversationAlreadyExistsException:
+        pass
+
+
+def main():
+    fixtures.setup()
+    fixtures.create_schema()
+    try:
+        print('%13s %14s %14s' % ('conversations', 'grouping',
+                                  'fingerprint'))
+        created = 0
+        for count in CONVERSATION_COUNTS:
+            # every conversation has the same heavy user
+            for i in range(created, count):
+                users = ['heavy'] + ['user%d-%d' % (i, j)
+                                     for j in range(PARTICIPANT_COUNT - 1)]
+                fixtures.create_conversation(users, 0)
+            created = count
+            participants = ['heavy', 'new1', 'new2']
+
+            before = fixtures.timed(grouping_validate_conversation,
+                                    participants)
+            after = fixtures.timed(fingerprint_validate_conversation,
+                                   participants)
+            print('%13d %12.2fms %12.2fms' % (count, before, after))
+    finally:
+        fixtures.drop_schema()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Minimal chat schema for benchmarks.
+
+The tables only carry the columns the chat plugin reads and writes, laid
+out the way skygear-server creates them.
+"""
+import os
+import time
+import uuid
+
+from psycopg2.extensions import AsIs
+
+from chat.user_conversation import update_participant_summary
+from skygear.container import SkygearContainer
+from skygear.options import options as skyoptions
+from skygear.utils import db
+
+APP_NAME = 'chat_benchmark'
+
+RECORD_COLUMNS = '''
+    _id text PRIMARY KEY,
+    _database_id text NOT NULL DEFAULT '',
+    _owner_id text,
+    _access jsonb,
+    _created_at timestamp without time zone NOT NULL DEFAULT NOW(),
+    _created_by text,
+    _updated_at timestamp without time zone NOT NULL DEFAULT NOW(),
+    _updated_by text
+'''
+
+TABLES = {
+    'user': '''
+        username text,
+        name text
+    ''',
+    'user_channel': '''
+        name text
+    ''',
+    'conversation': '''
+        title text,
+        metadata jsonb,
+        deleted boolean,
+        distinct_by_participants boolean,
+        last_message text,
+        participant_count double precision,
+        participant_hash text,
+        membership_version double precision
+    ''',
+    'user_conversation': '''
+        "user" text,
+        conversation text,
+        unread_count double precision,
+        last_read_message text,
+        is_admin boolean
+    ''',
+    'message': '''
+        attachment text,
+        body text,
+        metadata jsonb,
+        conversation text,
+        message_status text,
+        seq bigserial,
+        revision double precision,
+        edited_by text,
+        edited_at timestamp without time zone,
+        deleted boolean,
+        read_count double precision
+    ''',
+    'receipt': '''
+        "user" text,
+        message text,
+        read_at timestamp without time zone,
+        delivered_at timestamp without time zone
+    ''',
+}
+
+
+def setup():
+    if not os.getenv('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL is required to run benchmarks')
+    skyoptions.appname = APP_NAME
+    skyoptions.masterkey = os.getenv('MASTER_KEY', 'secret')
+    SkygearContainer.set_default_app_name(APP_NAME)
+    SkygearContainer.set_default_endpoint(
+        os.getenv('SKYGEAR_ENDPOINT', 'http://localhost:3000'))
+
+
+def schema_name():
+    return AsIs('app_' + APP_NAME)
+
+
+def create_schema():
+    with db.conn() as conn:
+        conn.execute('DROP SCHEMA IF EXISTS %(schema)s CASCADE',
+                     {'schema': schema_name()})
+        conn.execute('CREATE SCHEMA %(schema)s', {'schema': schema_name()})
+        for table, columns in TABLES.items():
+            conn.execute('CREATE TABLE %(schema)s.%(table)s (%(columns)s)', {
+                'schema': schema_name(),
+                'table': AsIs('"%s"' % table),
+                'columns': AsIs(RECORD_COLUMNS + ',' + columns),
+            })
+        conn.execute('''
+            CREATE INDEX ON %(schema)s.receipt (message, "user");
+            CREATE INDEX ON %(schema)s.user_conversation
+                ("user", conversation);
+            CREATE INDEX ON %(schema)s.message (conversation, seq);
+            CREATE INDEX ON %(schema)s.conversation (participant_hash);
+        ''', {'schema': schema_name()})
+
+
+def drop_schema():
+    with db.conn() as conn:
+        conn.execute('DROP SCHEMA IF EXISTS %(schema)s CASCADE',
+                     {'schema': schema_name()})
+
+
+def new_id():
+    return str(uuid.uuid4())
+
+
+def create_conversation(user_ids, message_count, sender_id=None):
+    """
+    Create a conversation with the given participants and messages, and
+    an empty receipt for every participant and message. Returns the
+    conversation id and the message ids in sending order.
+    """
+    conversation_id = new_id()
+    sender_id = sender_id or user_ids[0]
+    message_ids = [new_id() for _ in range(message_count)]
+    with db.conn() as conn:
+        conn.execute('''
+            INSERT INTO %(schema)s.conversation (_id, _owner_id, title)
+            VALUES (%(id)s, %(owner)s, 'benchmark')
+        ''', {'schema': schema_name(), 'id': conversation_id,
+              'owner': sender_id})
+        conn.execute('''
+            INSERT INTO %(schema)s.user_conversation
+                (_id, _owner_id, "user", conversation, unread_count,
+                 is_admin)
+            SELECT md5(u || %(id)s), u, u, %(id)s,
+                   CASE WHEN u = %(owner)s THEN 0 ELSE %(count)s END,
+                   u = %(owner)s
+            FROM unnest(%(users)s::text[]) u
+        ''', {'schema': schema_name(), 'id': conversation_id,
+              'owner': sender_id, 'users': user_ids,
+              'count': message_count})
+        update_participant_summary(conn, [conversation_id])
+        conn.execute('''
+            INSERT INTO %(schema)s.message
+                (_id, _owner_id, conversation, body, message_status,
+                 deleted, revision, read_count)
+            SELECT m, %(owner)s, %(id)s, 'hello', 'delivered', false, 1, 0
+            FROM unnest(%(messages)s::text[]) WITH ORDINALITY AS t(m, i)
+            ORDER BY i
+        ''', {'schema': schema_name(), 'id': conversation_id,
+              'owner': sender_id, 'messages': message_ids})
+        conn.execute('''
+            INSERT INTO %(schema)s.receipt (_id, _owner_id, "user", message)
+            SELECT md5(m || u), u, u, m
+            FROM unnest(%(messages)s::text[]) m,
+                 unnest(%(users)s::text[]) u
+        ''', {'schema': schema_name(), 'messages': message_ids,
+              'users': user_ids})
+    return conversation_id, message_ids
+
+
+def timed(fn, *args, setup=None, repeat=5, **kwargs):
+    """
+    Return the best wall time of `repeat` runs of fn, in milliseconds.
+    `setup` is called before every run and is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
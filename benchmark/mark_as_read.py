@@ -0,0 +1,152 @@
+"""
+Compare the set-based mark_messages_as_read against the previous
+implementation, which ran one statement per message.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres \
+        python -m benchmark.mark_as_read
+"""
+from chat.message import Message
+from chat.receipt_handlers import mark_messages_as_read
+from skygear.models import RecordID, Reference
+from skygear.utils import db
+from skygear.utils.context import current_user_id, start_context
+
+from . import fixtures
+
+MESSAGE_COUNTS = [1, 20, 200]
+
+
+def per_message_mark_as_read(message_ids):
+    user_id = current_user_id()
+    unread_message_ids = []
+
+    with db.conn() as conn:
+        for message_id in message_ids:
+            cur = conn.execute('''
+                WITH unread_receipt AS (
+                    SELECT r._id AS _id, r.message AS message_id
+                    FROM %(schema_name)s.receipt r
+                    WHERE r.message = %(message_id)s
+                    AND r.user = %(user_id)s
+                    AND read_at IS NULL LIMIT 1
+                ),
+                this_message AS (
+                    SELECT message.conversation, message.seq, message._id
+                    FROM %(schema_name)s.message, unread_receipt
+                    WHERE message._id = unread_receipt.message_id
+                    LIMIT 1
+                ),
+                last_read_message AS(
+                    SELECT last_read_message AS _id
+                    FROM %(schema_name)s.user_conversation uc,
+                         this_message
+                    WHERE uc.user = %(user_id)s
+                    AND uc.conversation = this_message.conversation
+                    LIMIT 1
+                )
+                ,last_read_message_seq AS (
+                    SELECT message.seq
+                    FROM %(schema_name)s.message,
+                         last_read_message
+                    WHERE message._id = last_read_message._id
+                    LIMIT 1
+                ),
+                update_last_read_message AS (
+                    UPDATE %(schema_name)s.user_conversation uc
+                    SET last_read_message =
+                    CASE WHEN
+                        this_message.seq > last_read_message_seq.seq
+                    THEN
+                        this_message._id
+                    ELSE
+                        last_read_message._id
+                    END
+                    FROM this_message,
+                         last_read_message_seq,
+                         last_read_message
+                    WHERE uc.user = %(user_id)s
+                    AND uc.conversation = this_message.conversation
+                ),
+                update_read_at AS (
+                    UPDATE %(schema_name)s.receipt
+                    SET read_at = NOW()
+                    FROM unread_receipt
+                    WHERE receipt._id = unread_receipt._id
+                ),
+                update_unread_count AS (
+                    UPDATE %(schema_name)s.user_conversation uc
+                    SET unread_count =
+                    CASE WHEN
+                        unread_count <= 0
+                    THEN
+                        0
+                    ELSE
+                        unread_count - 1
+                    END
+                    FROM unread_receipt,
+                         this_message
+                    WHERE uc.user = %(user_id)s
+                    AND uc.conversation = this_message.conversation
+                )
+                SELECT message_id
+                FROM unread_receipt
+            ''', {
+                'schema_name': fixtures.schema_name(),
+                'user_id': user_id,
+                'message_id': message_id
+            })
+            row = cur.fetchone()
+            if row is not None:
+                unread_message_ids.append(row[0])
+
+    return unread_message_ids
+
+
+def set_based_mark_as_read(messages):
+    with db.conn() as conn:
+        mark_messages_as_read(conn, messages)
+
+
+def reset(conversation_id, message_count):
+    with db.conn() as conn:
+        conn.execute('''
+            UPDATE %(schema)s.receipt SET read_at = NULL;
+            UPDATE %(schema)s.message SET read_count = 0;
+            UPDATE %(schema)s.user_conversation
+            SET unread_count = %(count)s, last_read_message = NULL
+            WHERE conversation = %(id)s;
+        ''', {'schema': fixtures.schema_name(), 'id': conversation_id,
+              'count': message_count})
+
+
+def main():
+    fixtures.setup()
+    fixtures.create_schema()
+    try:
+        users = ['sender', 'reader']
+        print('%8s %14s %14s' % ('messages', 'per-message', 'set-based'))
+        for count in MESSAGE_COUNTS:
+            conversation_id, message_ids = \
+                fixtures.create_conversation(users, count)
+            messages = [Message(RecordID('message', message_id), 'sender',
+                                None,
+                                data={'conversation': Reference(
+                                    RecordID('conversation',
+                                             conversation_id))})
+                        for message_id in message_ids]
+
+            def setup():
+                reset(conversation_id, count)
+
+            with start_context({'user_id': 'reader'}):
+                before = fixtures.timed(per_message_mark_as_read,
+                                        message_ids, setup=setup)
+                after = fixtures.timed(set_based_mark_as_read,
+                                       messages, setup=setup)
+            print('%8d %12.2fms %12.2fms' % (count, before, after))
+    finally:
+        fixtures.drop_schema()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Compare deriving message status from the maintained read and participant
+counters against the previous implementation, which counted receipt and
+user_conversation rows for every update.
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres \
+        python -m benchmark.message_status
+"""
+from chat.message import Message
+from skygear.models import RecordID, Reference
+from skygear.utils import db
+
+from . import fixtures
+
+PARTICIPANT_COUNTS = [2, 100, 1000]
+MESSAGE_COUNT = 20
+
+
+def counting_update_message_status(messages):
+    with db.conn() as conn:
+        conn.execute('''
+            WITH
+              read_count AS (
+                SELECT message, COUNT(receipt.user) as count
+                FROM %(schema_name)s.receipt
+                WHERE message = ANY(%(message_ids)s)
+                    AND read_at IS NOT NULL
+                GROUP BY message
+              ),
+              participant_count AS (
+                SELECT conversation, count(1) as count
+                FROM %(schema_name)s.user_conversation
+                WHERE conversation = ANY(%(conversation_ids)s)
+                GROUP BY conversation
+              ),
+              new_status AS (
+                SELECT m._id,
+                  CASE
+                    WHEN COALESCE(read_count.count, 0) = 0 THEN 'delivered'
+                    WHEN read_count.count <
+                        COALESCE(participant_count.count, 0)
+                        THEN 'some_read'
+                    ELSE 'all_read'
+                  END AS message_status
+                FROM %(schema_name)s.message m
+                LEFT JOIN read_count ON read_count.message = m._id
+                LEFT JOIN participant_count
+                    ON participant_count.conversation = m.conversation
+                WHERE m._id = ANY(%(message_ids)s)
+              )
+            UPDATE %(schema_name)s.message
+            SET _updated_at = NOW(),
+                message_status = new_status.message_status
+            FROM new_status
+            WHERE message._id = new_status._id
+            ''', {
+                'schema_name': fixtures.schema_name(),
+                'message_ids': [message.id.key for message in messages],
+                'conversation_ids': list({message.conversation_id
+                                          for message in messages})
+            })
+
+
+def counter_update_message_status(messages):
+    with db.conn() as conn:
+        Message.update_all_message_status(conn, messages)
+
+
+def read_half(conversation_id):
+    with db.conn() as conn:
+        conn.execute('''
+            UPDATE %(schema)s.receipt r
+            SET read_at = NOW()
+            FROM %(schema)s.message m
+            WHERE m._id = r.message
+                AND m.conversation = %(id)s
+                AND ('x' || substr(md5(r."user"), 1, 1))::bit(4)::int < 8;
+            UPDATE %(schema)s.message m
+            SET read_count = (
+                SELECT COUNT(*) FROM %(schema)s.receipt r
+                WHERE r.message = m._id AND r.read_at IS NOT NULL
+            )
+            WHERE m.conversation = %(id)s;
+        ''', {'schema': fixtures.schema_name(), 'id': conversation_id})
+
+
+def main():
+    fixtures.setup()
+    fixtures.create_schema()
+    try:
+        print('%12s %14s %14s' % ('participants', 'counting', 'counters'))
+        for count in PARTICIPANT_COUNTS:
+            users = ['user%d' % i for i in range(count)]
+            conversation_id, message_ids = \
+                fixtures.create_conversation(users, MESSAGE_COUNT)
+            read_half(conversation_id)
+            messages = [Message(RecordID('message', message_id), users[0],
+                                None,
+                                data={'conversation': Reference(
+                                    RecordID('conversation',
+                                             conversation_id))})
+                        for message_id in message_ids]
+
+            before = fixtures.timed(counting_update_message_status, messages)
+            after = fixtures.timed(counter_update_message_status, messages)
+            print('%12d %12.2fms %12.2fms' % (count, before, after))
+    finally:
+        fixtures.drop_schema()
+
+
+if __name__ == '__main__':
+    main()
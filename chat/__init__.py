@@ -8,11 +8,15 @@ from .decorators import (after_conversation_created,
                          after_message_sent, after_message_updated,
                          after_users_added_to_conversation,
                          after_users_removed_from_conversation, typing_started)
+from .hooks import get_users
 from .initialize import register_initialization_event_handlers
 from .message_handlers import register_message_hooks, register_message_lambdas
 from .receipt_handlers import register_receipt_hooks, register_receipt_lambdas
 from .typing import register_typing_lambda
-from .user_conversation import register_user_conversation_lambdas
+from .user import register_user_hooks
+from .user_channel import register_user_channel_hooks
+from .user_conversation import (register_user_conversation_hooks,
+                                register_user_conversation_lambdas)
 
 
 def includeme(settings):
@@ -23,10 +27,39 @@ def includeme(settings):
     register_message_lambdas(settings)
     register_receipt_hooks(settings)
     register_receipt_lambdas(settings)
+    register_user_conversation_hooks(settings)
     register_user_conversation_lambdas(settings)
+    register_user_channel_hooks(settings)
+    register_user_hooks(settings)
     register_typing_lambda(settings)
 
 
 parser = SettingsParser('SKYGEAR_CHAT')
+parser.add_setting('pubsub_pool_size', default=4, atype=int, required=False)
+parser.add_setting('pubsub_max_idle', default=60, atype=int, required=False)
+parser.add_setting('pubsub_workers', default=2, atype=int, required=False)
+parser.add_setting('pubsub_queue_size', default=1000, atype=int,
+                   required=False)
+parser.add_setting('user_channel_cache_size', default=10000, atype=int)
+parser.add_setting('user_channel_cache_ttl', default=60, atype=int)
+parser.add_setting('get_messages_deleted_limit', default=100, atype=int)
+parser.add_setting('direct_read', default=False, atype=bool)
+parser.add_setting('membership_cache_backend', default='')
+parser.add_setting('membership_cache_size', default=10000, atype=int)
+parser.add_setting('membership_cache_ttl', default=60, atype=int)
+parser.add_setting('user_cache_backend', default='')
+parser.add_setting('user_cache_size', default=10000, atype=int)
+parser.add_setting('user_cache_ttl', default=60, atype=int)
+parser.add_setting('hook_user_ids_only', default=False, atype=bool)
+parser.add_setting('external_hooks', default='*')
+parser.add_setting('hook_registry_ttl', default=60, atype=int)
+parser.add_setting('hook_workers', default=2, atype=int)
+parser.add_setting('hook_queue_size', default=1000, atype=int)
+parser.add_setting('hook_batch_size', default=50, atype=int)
+parser.add_setting('hook_retries', default=3, atype=int)
+parser.add_setting('hook_retry_delay', default=0.5, atype=float)
+parser.add_setting('typing_batch_window', default=0.2, atype=float)
+parser.add_setting('typing_dedup_window', default=0.5, atype=float)
+parser.add_setting('typing_membership_ttl', default=5, atype=float)
 
 add_parser('chat', parser)
@@ -0,0 +1,152 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import importlib
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the caches used by the chat plugin.
+
+    Values must be JSON serializable, so that a backend shared by many
+    plugin processes, such as one backed by Redis or memcached, can be
+    used in place of the in-process LRUCache.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    @abstractmethod
+    def get_many(self, keys):
+        """
+        Return a dict of the cached values for the given keys. Keys that
+        are not cached are left out.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def set_many(self, mapping):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete_many(self, keys):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError()
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        self.delete_many([key])
+
+
+class LRUCache(CacheBackend):
+    """
+    A thread-safe in-process LRU cache.
+
+    At most `maxsize` entries are kept, and entries older than `ttl`
+    seconds are treated as missing. Hits and misses are counted for
+    monitoring.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60, timer=time.monotonic):
+        super(LRUCache, self).__init__(maxsize=maxsize, ttl=ttl)
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires_at = entry
+            if expires_at > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get(key, self.timer())
+        return default if value is _MISSING else value
+
+    def get_many(self, keys):
+        """
+        Return a dict of the cached values for the given keys. Keys that
+        are not cached are left out.
+        """
+        result = {}
+        with self._lock:
+            now = self.timer()
+            for key in keys:
+                value = self._get(key, now)
+                if value is not _MISSING:
+                    result[key] = value
+        return result
+
+    def set_many(self, mapping):
+        with self._lock:
+            expires_at = self.timer() + self.ttl
+            for key, value in mapping.items():
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._data)}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def create_cache(backend, maxsize, ttl):
+    """
+    Create a cache with the given size and ttl. `backend` is the dotted
+    path of a CacheBackend class; an empty backend creates an LRUCache.
+    """
+    if not backend:
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    module_name, _, class_name = backend.rpartition('.')
+    cls = getattr(importlib.import_module(module_name), class_name)
+    return cls(maxsize=maxsize, ttl=ttl)
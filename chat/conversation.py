@@ -4,8 +4,6 @@ from skygear.models import (ACCESS_CONTROL_ENTRY_LEVEL_READ,
 
 from .database import Database
 from .exc import SkygearChatException
-from .predicate import Predicate
-from .query import Query
 from .record import ChatRecord
 from .user_conversation import UserConversation
 
@@ -17,6 +15,7 @@ class Conversation(ChatRecord):
         database = self._get_database()
         database.save([{'_id': Database._encode_id(self.id),
                         'distinct_by_participants': True}])
+        self.forget([self])
 
     @classmethod
     def equal_record(cls, record1, record2):
@@ -67,6 +66,16 @@ class Conversation(ChatRecord):
     @classmethod
     def fetch_all_with_paging(cls, page, page_size, order='desc'):
         ucs = UserConversation.fetch_all_with_paging(page, page_size, order)
+        return cls.__from_user_conversations(ucs)
+
+    @classmethod
+    def fetch_all_with_cursor(cls, cursor, page_size, order='desc'):
+        ucs, next_cursor = UserConversation.fetch_all_with_cursor(
+            cursor, page_size, order)
+        return cls.__from_user_conversations(ucs), next_cursor
+
+    @classmethod
+    def __from_user_conversations(cls, ucs):
         result = [cls.__uc_to_conversation(uc)
                   for uc in ucs]
         result = [c for c in result if c is not None]
@@ -101,25 +110,12 @@ class Conversation(ChatRecord):
 
     @classmethod
     def __get_participants_and_admins(cls, conversations):
-        database = cls._get_database()
-        conversation_ids = [c.id.key for c in conversations]
-
-        admins = {}
-        participants = {}
-        for key in conversation_ids:
-            admins[key] = []
-            participants[key] = []
-        predicate = Predicate(conversation__in=list(set(conversation_ids)))
-        query_result = database.query(
-                       Query(UserConversation.record_type, predicate=predicate,
-                             limit=None)
-                       )
-        for row in query_result:
-            conversation_id = row['conversation'].recordID.key
-            if row['is_admin']:
-                admins[conversation_id].append(row['user'].recordID.key)
-            participants[conversation_id].append(row['user'].recordID.key)
-
+        members = UserConversation.fetch_members(
+            [c.id.key for c in conversations])
+        participants = {key: member['participant_ids']
+                        for key, member in members.items()}
+        admins = {key: member['admin_ids']
+                  for key, member in members.items()}
         return participants, admins
 
     @classmethod
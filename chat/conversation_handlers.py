@@ -20,7 +20,8 @@ from .hooks import (send_after_conversation_created_hook,
 from .message import Message
 from .pubsub import _publish_record_event
 from .roles import RolesHelper
-from .user_conversation import UserConversation
+from .user_conversation import (UserConversation, invalidate_memberships,
+                                participant_hash, refresh_participant_summary)
 from .utils import (_get_container, _get_schema_name,
                     current_context_has_master_key)
 
@@ -38,24 +39,14 @@ def __validate_conversation(participants):
     with db.conn() as conn:
         result = conn.execute("""
                               SELECT c._id
-                                   FROM %(schema_name)s.conversation AS c
-                              WHERE c._id IN (
-                                  SELECT uc.conversation
-                                  FROM %(schema_name)s.user_conversation AS uc
-                                  WHERE uc.conversation IN (
-                                      SELECT uc.conversation
-                                      FROM %(schema_name)s.user_conversation
-                                      AS uc
-                                      WHERE uc.user IN %(user_ids)s
-                                      GROUP BY uc.conversation
-                                      HAVING
-                                          COUNT(DISTINCT uc.user) = %(count)s)
-                                  GROUP BY uc.conversation
-                                  HAVING COUNT(DISTINCT uc.user) = %(count)s)
+                                  FROM %(schema_name)s.conversation AS c
+                              WHERE c.participant_hash = %(hash)s
+                                  AND c.participant_count = %(count)s
                               ORDER BY c._created_at DESC
+                              LIMIT 1
                               """, {'schema_name': AsIs(_get_schema_name()),
-                                    'user_ids': tuple(participants),
-                                    'count': len(participants)})
+                                    'hash': participant_hash(participants),
+                                    'count': len(set(participants))})
         first_row = result.first()
     valid = first_row is None
     if not valid:
@@ -82,12 +73,8 @@ def __update_admin_roles(container, conversation_id, users, flag):
 
 
 def __update_admin_flags(container, conversation_id, user_ids, flag):
-    for user_id in user_ids:
-        uc = UserConversation.fetch_one(conversation_id, user_id=user_id)
-        if uc is None:
-            c = Conversation.new(conversation_id, user_id)
-            uc = UserConversation.new(c, user_id)
-        uc.mark_admin(flag)
+    conversation = Conversation.new(conversation_id, current_user_id())
+    UserConversation.mark_all_admin(conversation, user_ids, flag)
 
 
 def notify_users(record,
@@ -120,6 +107,8 @@ def handle_leave_conversation(conversation_id):
     if uc is None:
         raise NotInConversationException()
     uc.delete()
+    refresh_participant_summary([conversation_id])
+    invalidate_memberships([conversation_id])
     return {'status': 'OK'}
 
 
@@ -127,12 +116,9 @@ def handle_add_participants(conversation_id,
                             participant_ids,
                             is_first_time=False):
 
-    existing_participants = []
-    for participant in participant_ids:
-        uc = UserConversation.fetch_one(conversation_id,
-                                        user_id=participant)
-        if uc is not None:
-            existing_participants.append(participant)
+    participant_ids = list(dict.fromkeys(participant_ids))
+    existing_participants = UserConversation.fetch_existing_user_ids(
+        conversation_id, participant_ids)
 
     participant_ids = [x for x in participant_ids
                        if x not in existing_participants]
@@ -143,8 +129,13 @@ def handle_add_participants(conversation_id,
                                participant_ids, True)
 
     conversation = Conversation.new(conversation_id, current_user_id())
-    for participant_id in participant_ids:
-        UserConversation.new(conversation, participant_id).save()
+    if participant_ids:
+        UserConversation.save_all([
+            UserConversation.new(conversation, participant_id)
+            for participant_id in participant_ids
+        ], atomic=True)
+        refresh_participant_summary([conversation_id])
+    invalidate_memberships([conversation_id])
 
     serialized_conversation = serialize_record(conversation)
 
@@ -173,6 +164,8 @@ def handle_remove_participants(conversation_id, participant_ids):
     ucs = [UserConversation.new(conversation, participant_id)
            for participant_id in participant_ids]
     UserConversation.delete_all(ucs)
+    refresh_participant_summary([conversation_id])
+    invalidate_memberships([conversation_id])
     conversation.mark_non_distinct()
 
     conversation = Conversation.fetch_one(conversation_id, with_uc=False)
@@ -189,10 +182,17 @@ def handle_remove_participants(conversation_id, participant_ids):
     return {'conversation': serialized_conversation}
 
 
-def handle_admins_lambda(conversation_id, admin_ids, flag):
+def __update_admins(conversation_id, admin_ids, flag):
     container = _get_container()
     __update_admin_roles(container, conversation_id, admin_ids, flag)
     __update_admin_flags(container, conversation_id, admin_ids, flag)
+
+
+def handle_admins_lambda(conversation_id, admin_ids, flag):
+    __update_admins(conversation_id, admin_ids, flag)
+    # marking users who are not participants adds them
+    refresh_participant_summary([conversation_id])
+    invalidate_memberships([conversation_id])
     r = Conversation.fetch_one(conversation_id)
     return {'conversation': serialize_record(r)}
 
@@ -214,6 +214,9 @@ def register_conversation_hooks(settings):
                            'last_read_message',
                            'unread_count',
                            'last_message_ref',
+                           'membership_version',
+                           'participant_count',
+                           'participant_hash',
                            'participant_ids']
         for key in disallowed_keys:
             if key in record:
@@ -278,8 +281,19 @@ def handle_get_conversation_lambda(conversation_id, include_last_message):
 def handle_get_conversations_lambda(page,
                                     page_size,
                                     include_last_message,
-                                    order='desc'):
-    result = Conversation.fetch_all_with_paging(page, page_size, order)
+                                    order='desc',
+                                    cursor=None):
+    """
+    Without `page`, conversations are paginated by cursor: each response
+    carries a `next_cursor` to pass back for the following page, or None
+    on the last page.
+    """
+    next_cursor = None
+    if page is None:
+        result, next_cursor = Conversation.fetch_all_with_cursor(
+            cursor, page_size, order)
+    else:
+        result = Conversation.fetch_all_with_paging(page, page_size, order)
     if include_last_message:
         messages = {}
         message_refs = []
@@ -295,13 +309,17 @@ def handle_get_conversations_lambda(page,
             result[i] = __update_conversation_messages(
                         result[i], messages)
 
-    return {"conversations": [serialize_record(r) for r in result]}
+    response = {"conversations": [serialize_record(r) for r in result]}
+    if page is None:
+        response['next_cursor'] = next_cursor
+    return response
 
 
 def handle_delete_conversation_lambda(conversation_id):
     __validate_user_is_admin(conversation_id)
     conversation = Conversation.fetch_one(conversation_id)
-    handle_admins_lambda(conversation_id, conversation['admin_ids'], False)
+    # admins are participants too, so only removing them changes members
+    __update_admins(conversation_id, conversation['admin_ids'], False)
     handle_remove_participants(conversation_id,
                                conversation['participant_ids'])
     serialized_conversation = serialize_record(conversation)
@@ -347,7 +365,9 @@ def handle_create_conversation_lambda(participants, title, meta, options):
     conversation['admin_ids'] = []
     conversation['participant_ids'] = []
     handle_add_participants(conversation_id, participants, True)
-    handle_admins_lambda(conversation_id, admins, True)
+    # admins are among the participants added above
+    __update_admins(conversation_id, admins, True)
+    invalidate_memberships([conversation_id])
     conversation['admin_ids'] = admins
     participants = list(set(participants + admins))
     conversation['participant_ids'] = list(set(participants + admins))
@@ -389,14 +409,16 @@ def register_conversation_lambdas(settings):
 
     @skygear.op("chat:get_conversations",
                 auth_required=True, user_required=True)
-    def get_conversations_lambda(page,
-                                 page_size,
-                                 include_last_message,
-                                 order='desc'):
+    def get_conversations_lambda(page=None,
+                                 page_size=50,
+                                 include_last_message=False,
+                                 order='desc',
+                                 cursor=None):
         return handle_get_conversations_lambda(page,
                                                page_size,
                                                include_last_message,
-                                               order)
+                                               order,
+                                               cursor)
 
     @skygear.op("chat:get_conversation",
                 auth_required=True, user_required=True)
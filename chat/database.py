@@ -15,7 +15,9 @@
 
 from skygear.encoding import deserialize_record, serialize_record
 from skygear.models import Record
+from skygear.settings import settings
 
+from . import direct_query
 from .asset import sign_asset_url
 from .exc import SkygearChatException
 
@@ -57,7 +59,19 @@ class Database(object):
             'ids': ids
         })
 
-    def query(self, query):
+    def _is_direct(self, query):
+        direct = query.direct
+        if direct is None:
+            direct = settings.chat.direct_read
+        return direct and self.database_id == '_public'
+
+    def _query_direct(self, query):
+        try:
+            return direct_query.fetch(query)
+        except direct_query.UnsupportedQuery:
+            return None
+
+    def _query_container(self, query):
         include = {v: {"$type": "keypath", "$val": v}
                    for v in list(set(query.include))}
 
@@ -75,7 +89,14 @@ class Database(object):
         result = self.container.send_action('record:query', payload)
         if 'error' in result:
             raise SkygearChatException(result['error']['message'])
-        result = result['result']
+        return result['result']
+
+    def query(self, query):
+        result = None
+        if self._is_direct(query):
+            result = self._query_direct(query)
+        if result is None:
+            result = self._query_container(query)
         output = []
         for r in result:
             record = deserialize_record(r)
@@ -0,0 +1,273 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Run chat record queries directly against the Skygear database.
+
+Rows are returned in the same serialized form as a `record:query` action,
+so records read here are decoded exactly like records read through the
+container. Chat queries are sent with the master key, for which Skygear
+does not filter records by ACL; reads here do not filter by ACL either
+and callers check membership themselves, as they do for container
+queries.
+"""
+import re
+from datetime import datetime, timezone
+
+from psycopg2.extensions import AsIs
+
+from skygear.encoding import deserialize_value
+from skygear.models import Record, RecordID, Reference
+from skygear.utils import db
+
+from .predicate import Predicate
+from .utils import _get_schema_name
+
+# Reference and asset fields of the chat record types, as defined in
+# initialize.py. Record types not listed here are read through the
+# container.
+REFERENCE_FIELDS = {
+    'conversation': {'last_message': 'message'},
+    'message': {'conversation': 'conversation',
+                'edited_by': 'user'},
+    'receipt': {'user': 'user',
+                'message': 'message'},
+    'user': {},
+    'user_conversation': {'user': 'user',
+                          'conversation': 'conversation',
+                          'last_read_message': 'message'},
+}
+ASSET_FIELDS = {
+    'message': ['attachment'],
+}
+OPERATORS = {
+    'eq': '=',
+    'ne': '<>',
+    'lt': '<',
+    'gt': '>',
+    'lte': '<=',
+    'gte': '>=',
+}
+SORT_ORDERS = {
+    'asc': 'ASC',
+    'desc': 'DESC',
+}
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class UnsupportedQuery(Exception):
+    """
+    Raised when a query cannot be translated to SQL and has to be sent
+    through the container instead.
+    """
+    pass
+
+
+def _column(name):
+    if not _IDENTIFIER.match(name):
+        raise UnsupportedQuery('unsupported keypath %s' % name)
+    return '"%s"' % name
+
+
+def _sql_value(value):
+    if isinstance(value, dict):
+        value = deserialize_value(value)
+    if isinstance(value, (list, tuple)):
+        return [_sql_value(v) for v in value]
+    if isinstance(value, Record):
+        return value.id.key
+    if isinstance(value, Reference):
+        return value.recordID.key
+    if isinstance(value, RecordID):
+        return value.key
+    if isinstance(value, datetime):
+        # timestamps are stored in UTC without time zone, naive datetimes
+        # are taken as local time like the container encoder does
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise UnsupportedQuery('unsupported value %r' % value)
+
+
+def _compile_condition(condition, params):
+    field, op = condition[0].split('__')
+    column = _column(field)
+    value = _sql_value(condition[1])
+    if op != 'in' and op not in OPERATORS:
+        raise UnsupportedQuery('unsupported operator %s' % op)
+    if value is None and op == 'eq':
+        return '%s IS NULL' % column
+    if value is None and op == 'ne':
+        return '%s IS NOT NULL' % column
+
+    name = 'p%d' % len(params)
+    params[name] = value
+    if op == 'in':
+        if not isinstance(value, list):
+            raise UnsupportedQuery('in requires a list')
+        return '%s = ANY(%%(%s)s)' % (column, name)
+    return '%s %s %%(%s)s' % (column, OPERATORS[op], name)
+
+
+def _compile_predicate(predicate, params):
+    if isinstance(predicate, tuple):
+        return _compile_condition(predicate, params)
+    clauses = [_compile_predicate(condition, params)
+               for condition in predicate.conditions]
+    if len(clauses) == 0:
+        return 'TRUE'
+    if predicate.op == Predicate.NOT:
+        return 'NOT (%s)' % clauses[0]
+    if len(clauses) == 1:
+        return clauses[0]
+    joiner = ' OR ' if predicate.op == Predicate.OR else ' AND '
+    return '(%s)' % joiner.join(clauses)
+
+
+def compile_query(query):
+    """
+    Translate a chat Query to an SQL statement and its parameters.
+    Raises UnsupportedQuery for queries that have to be sent through the
+    container.
+    """
+    if query.record_type not in REFERENCE_FIELDS:
+        raise UnsupportedQuery('unsupported record type %s' %
+                               query.record_type)
+    for key in query.include:
+        if key not in REFERENCE_FIELDS[query.record_type]:
+            raise UnsupportedQuery('unsupported include %s' % key)
+
+    params = {}
+    where = _compile_predicate(query.predicate, params)
+    params['schema_name'] = AsIs(_get_schema_name())
+    params['table'] = AsIs(_column(query.record_type))
+    sql = '''
+        SELECT *
+        FROM %%(schema_name)s.%%(table)s
+        WHERE _database_id = '' AND %s
+    ''' % where
+    if query.sort:
+        orders = []
+        for keypath, order in query.sort:
+            if order not in SORT_ORDERS:
+                raise UnsupportedQuery('unsupported order %s' % order)
+            orders.append('%s %s' % (_column(keypath['$val']),
+                                     SORT_ORDERS[order]))
+        sql += ' ORDER BY ' + ', '.join(orders)
+    if query.limit is not None:
+        params['limit'] = query.limit
+        sql += ' LIMIT %(limit)s'
+    if query.offset is not None:
+        params['offset'] = query.offset
+        sql += ' OFFSET %(offset)s'
+    return sql, params
+
+
+def _serialize_datetime(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _serialize_value(column, value, references, assets):
+    if column in references:
+        return {'$type': 'ref', '$id': references[column] + '/' + value}
+    if column in assets:
+        return {'$type': 'asset', '$name': value}
+    if isinstance(value, datetime):
+        return {'$type': 'date', '$date': _serialize_datetime(value)}
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _serialize_row(record_type, row):
+    references = REFERENCE_FIELDS[record_type]
+    assets = ASSET_FIELDS.get(record_type, [])
+    output = {
+        '_id': record_type + '/' + row['_id'],
+        '_ownerID': row['_owner_id'],
+        '_access': row['_access'],
+        '_created_by': row['_created_by'],
+        '_updated_by': row['_updated_by'],
+    }
+    if row['_created_at'] is not None:
+        output['_created_at'] = _serialize_datetime(row['_created_at'])
+    if row['_updated_at'] is not None:
+        output['_updated_at'] = _serialize_datetime(row['_updated_at'])
+    for column, value in row.items():
+        if column.startswith('_') or value is None:
+            continue
+        output[column] = _serialize_value(column, value, references, assets)
+    return output
+
+
+def _fetch_by_ids(conn, record_type, ids):
+    cur = conn.execute('''
+        SELECT *
+        FROM %(schema_name)s.%(table)s
+        WHERE _database_id = '' AND _id = ANY(%(ids)s)
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'table': AsIs(_column(record_type)),
+            'ids': list(ids)
+        }
+    )
+    return {row['_id']: _serialize_row(record_type, dict(row))
+            for row in cur}
+
+
+def _fill_asset_content_types(conn, records, fields):
+    assets = [record[field] for record in records for field in fields
+              if field in record]
+    if len(assets) == 0:
+        return
+    cur = conn.execute('''
+        SELECT id, content_type
+        FROM %(schema_name)s._asset
+        WHERE id = ANY(%(names)s)
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'names': list({asset['$name'] for asset in assets})
+        }
+    )
+    content_types = {row[0]: row[1] for row in cur}
+    for asset in assets:
+        if content_types.get(asset['$name']):
+            asset['$content_type'] = content_types[asset['$name']]
+
+
+def fetch(query):
+    """
+    Run a chat Query and return the records serialized like the result
+    of a `record:query` action, including `_transient` for includes.
+    """
+    sql, params = compile_query(query)
+    record_type = query.record_type
+    with db.conn() as conn:
+        rows = [dict(row) for row in conn.execute(sql, params)]
+        records = [_serialize_row(record_type, row) for row in rows]
+        _fill_asset_content_types(conn, records,
+                                  ASSET_FIELDS.get(record_type, []))
+
+        for key in set(query.include):
+            target_type = REFERENCE_FIELDS[record_type][key]
+            ids = {row[key] for row in rows if row.get(key)}
+            if len(ids) == 0:
+                continue
+            targets = _fetch_by_ids(conn, target_type, ids)
+            _fill_asset_content_types(conn, list(targets.values()),
+                                      ASSET_FIELDS.get(target_type, []))
+            for row, record in zip(rows, records):
+                target = targets.get(row.get(key))
+                if target is not None:
+                    record.setdefault('_transient', {})[key] = target
+    return records
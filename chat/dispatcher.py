@@ -0,0 +1,150 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import queue
+import threading
+
+from skygear.settings import settings
+from skygear.utils.context import current_context, start_context
+
+from .utils import REQUEST_CACHE_KEY
+
+logger = logging.getLogger(__name__)
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if not _dispatcher:
+            _dispatcher = Dispatcher(
+                workers=settings.chat.pubsub_workers,
+                maxsize=settings.chat.pubsub_queue_size)
+    return _dispatcher
+
+
+class Dispatcher:
+    """
+    Run jobs off the request thread through bounded queues.
+
+    Each of the `workers` daemon threads has its own queue of at most
+    `maxsize` jobs. Jobs submitted with `submit_ordered` and the same key
+    go to the same worker, so they run in the order they were submitted;
+    other jobs are spread over the workers in turn. Jobs are executed
+    inside a copy of the request context they were submitted from. When a
+    queue is full, submitting waits up to `put_timeout` seconds for room
+    before dropping the job. With `workers=0` jobs run inline on the
+    calling thread.
+    """
+
+    def __init__(self, workers=2, maxsize=1000, put_timeout=0.1):
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self._next = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'delivered': 0,
+            'failed': 0,
+            'dropped': 0,
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i, work_queue in enumerate(self.queues):
+                thread = threading.Thread(target=self._work,
+                                          args=(work_queue,),
+                                          name='chat-dispatcher-%d' % i,
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _queue_for(self, key):
+        if key is None:
+            with self._lock:
+                index = self._next
+                self._next = (self._next + 1) % self.workers
+        else:
+            index = hash(key) % self.workers
+        return self.queues[index]
+
+    def submit(self, fn, *args, **kwargs):
+        return self.submit_ordered(None, fn, *args, **kwargs)
+
+    def submit_ordered(self, ordering_key, fn, *args, **kwargs):
+        """
+        Queue a job. Jobs with the same hashable `ordering_key` run one
+        after another in submission order; None means no ordering.
+        """
+        self._count('submitted')
+        context = dict(current_context())
+        # objects cached for the request are not shared with workers
+        context.pop(REQUEST_CACHE_KEY, None)
+        job = (context, fn, args, kwargs)
+        if self.workers <= 0:
+            self._run(job)
+            return True
+
+        self._start()
+        try:
+            self._queue_for(ordering_key).put(job, timeout=self.put_timeout)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning('dispatch queue is full, dropping %s',
+                           getattr(fn, '__name__', fn))
+            return False
+        return True
+
+    def _run(self, job):
+        context, fn, args, kwargs = job
+        try:
+            with start_context(context):
+                fn(*args, **kwargs)
+        except Exception:
+            self._count('failed')
+            logger.exception('failed to dispatch %s',
+                             getattr(fn, '__name__', fn))
+        else:
+            self._count('delivered')
+
+    def _work(self, work_queue):
+        while True:
+            job = work_queue.get()
+            try:
+                self._run(job)
+            finally:
+                work_queue.task_done()
+
+    def join(self):
+        """
+        Block until every queued job has been processed.
+        """
+        for work_queue in self.queues:
+            work_queue.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = sum(work_queue.qsize()
+                              for work_queue in self.queues)
+        return stats
@@ -0,0 +1,216 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from requests.exceptions import ConnectionError, ConnectTimeout
+from urllib3.exceptions import NewConnectionError
+
+from skygear.settings import settings
+from skygear.utils.context import current_context, start_context
+
+from .dispatcher import Dispatcher
+from .utils import REQUEST_CACHE_KEY, _get_container
+
+logger = logging.getLogger(__name__)
+_hook_delivery = None
+_hook_delivery_lock = threading.Lock()
+
+
+def get_hook_delivery():
+    global _hook_delivery
+    with _hook_delivery_lock:
+        if _hook_delivery is None:
+            _hook_delivery = HookDelivery(
+                Dispatcher(workers=settings.chat.hook_workers,
+                           maxsize=settings.chat.hook_queue_size),
+                batch_size=settings.chat.hook_batch_size,
+                retries=settings.chat.hook_retries,
+                retry_delay=settings.chat.hook_retry_delay)
+    return _hook_delivery
+
+
+def _call_later(delay, fn, *args):
+    timer = threading.Timer(delay, fn, args)
+    timer.daemon = True
+    timer.start()
+
+
+def _is_connect_error(exc):
+    """
+    Return whether an exception means that the connection to Skygear
+    could not be established, so the hook cannot have been received.
+    """
+    if isinstance(exc, ConnectTimeout):
+        return True
+    if not isinstance(exc, ConnectionError) or len(exc.args) == 0:
+        return False
+    # requests wraps the urllib3 MaxRetryError, whose reason is the error
+    # of the last connection attempt
+    reason = getattr(exc.args[0], 'reason', exc.args[0])
+    return isinstance(reason, NewConnectionError)
+
+
+class HookDelivery(object):
+    """
+    Deliver chat hooks off the request thread.
+
+    Events are queued per hook name. The first event of a hook name
+    schedules a job on the dispatcher, which delivers up to `batch_size`
+    queued events of that hook in one pass over a shared keep-alive
+    connection, so a burst of events costs one job instead of one each.
+    Each event is delivered in the context it was sent from.
+
+    Hooks are not idempotent, so a delivery is retried only if the
+    connection could not be established. It is retried up to `retries`
+    times, `retry_delay` seconds later and doubling the wait after each
+    retry. Retries are put back on the dispatcher by `call_later` instead
+    of holding a worker while waiting. Other failures, and errors returned
+    by hook handlers, are logged and not retried.
+    """
+
+    def __init__(self, dispatcher, batch_size=50, retries=3, retry_delay=0.5,
+                 call_later=_call_later, timer=time.monotonic):
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.call_later = call_later
+        self.timer = timer
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._retry_done = threading.Condition(self._lock)
+        self._waiting_retries = 0
+        self._stats = {
+            'sent': 0,
+            'delivered': 0,
+            'failed': 0,
+            'retried': 0,
+            'batches': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def send(self, name, build_args):
+        """
+        Queue a hook. `build_args` is called on the delivering thread and
+        returns the hook arguments, so that the payload is assembled off
+        the request thread too.
+        """
+        context = dict(current_context())
+        # objects cached for the request are not shared with workers
+        context.pop(REQUEST_CACHE_KEY, None)
+        event = (context, build_args, self.timer())
+        with self._lock:
+            self._stats['sent'] += 1
+            events = self._pending.setdefault(name, [])
+            events.append(event)
+            schedule = len(events) == 1
+        if schedule:
+            self._schedule(name)
+
+    def _schedule(self, name):
+        if not self.dispatcher.submit(self._flush, name):
+            with self._lock:
+                dropped = self._pending.pop(name, [])
+                self._stats['failed'] += len(dropped)
+
+    def _flush(self, name):
+        with self._lock:
+            events = self._pending.get(name, [])
+            batch = events[:self.batch_size]
+            del events[:self.batch_size]
+            remaining = len(events) > 0
+            if not remaining:
+                self._pending.pop(name, None)
+            self._stats['batches'] += 1
+        for event in batch:
+            self._deliver(name, event, 0)
+        if remaining:
+            self._schedule(name)
+
+    def _deliver(self, name, event, attempt):
+        context, build_args, sent_at = event
+        with start_context(context):
+            try:
+                args = build_args()
+                result = _get_container().send_action(name, {'args': args})
+            except Exception as exc:
+                if attempt < self.retries and _is_connect_error(exc):
+                    self._retry_later(name, event, attempt + 1)
+                    return
+                self._count('failed')
+                logger.exception('failed to deliver %s', name)
+                return
+
+        if isinstance(result, dict) and 'error' in result:
+            self._count('failed')
+            logger.error('hook %s returned error: %s', name, result['error'])
+            return
+        latency = self.timer() - sent_at
+        with self._lock:
+            self._stats['delivered'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'],
+                                             latency)
+
+    def _retry_later(self, name, event, attempt):
+        with self._lock:
+            self._stats['retried'] += 1
+            self._waiting_retries += 1
+        delay = self.retry_delay * 2 ** (attempt - 1)
+        self.call_later(delay, self._retry, name, event, attempt)
+
+    def _retry(self, name, event, attempt):
+        submitted = self.dispatcher.submit(self._deliver, name, event,
+                                           attempt)
+        with self._lock:
+            if not submitted:
+                self._stats['failed'] += 1
+            self._waiting_retries -= 1
+            self._retry_done.notify_all()
+
+    def join(self):
+        """
+        Block until every queued hook has been delivered, including the
+        retries waiting to be queued again.
+        """
+        while True:
+            self.dispatcher.join()
+            with self._lock:
+                if self._waiting_retries == 0:
+                    return
+                self._retry_done.wait_for(lambda: self._waiting_retries == 0)
+
+    def stats(self):
+        """
+        Return delivery counters, the number of queued events including
+        the retries waiting to be queued again, and the average and
+        maximum delivery latency in seconds, measured from when a hook is
+        sent.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._waiting_retries + sum(
+                len(events) for events in self._pending.values())
+        delivered = stats['delivered']
+        stats['latency_avg'] = \
+            stats.pop('latency_total') / delivered if delivered else 0.0
+        return stats
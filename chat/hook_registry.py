@@ -0,0 +1,132 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import inspect
+import threading
+import time
+
+from skygear.registry import get_registry
+from skygear.settings import settings
+
+from .decorators import (AFTER_CONVERSATION_CREATED_HOOK,
+                         AFTER_CONVERSATION_DELETED_HOOK,
+                         AFTER_CONVERSATION_UPDATED_HOOK,
+                         AFTER_MESSAGE_DELETED_HOOK, AFTER_MESSAGE_SENT_HOOK,
+                         AFTER_MESSAGE_UPDATED_HOOK,
+                         AFTER_USERS_ADDED_TO_CONVERSATION_HOOK,
+                         AFTER_USERS_REMOVED_FROM_CONVERSATION_HOOK,
+                         TYPING_STARTED_HOOK)
+
+HOOK_NAMES = [
+    AFTER_MESSAGE_SENT_HOOK,
+    AFTER_MESSAGE_UPDATED_HOOK,
+    AFTER_MESSAGE_DELETED_HOOK,
+    TYPING_STARTED_HOOK,
+    AFTER_CONVERSATION_CREATED_HOOK,
+    AFTER_CONVERSATION_UPDATED_HOOK,
+    AFTER_CONVERSATION_DELETED_HOOK,
+    AFTER_USERS_ADDED_TO_CONVERSATION_HOOK,
+    AFTER_USERS_REMOVED_FROM_CONVERSATION_HOOK,
+]
+ALL_FIELDS = None
+
+_hook_registry = None
+_hook_registry_lock = threading.Lock()
+
+
+def _accepted_fields(func):
+    """
+    Return the names of the keyword arguments a hook handler accepts, or
+    ALL_FIELDS if it accepts any keyword argument.
+    """
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return ALL_FIELDS
+    fields = set()
+    for parameter in parameters:
+        if parameter.kind == inspect.Parameter.VAR_KEYWORD:
+            return ALL_FIELDS
+        if parameter.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                              inspect.Parameter.KEYWORD_ONLY):
+            fields.add(parameter.name)
+    return fields
+
+
+class HookRegistry(object):
+    """
+    Keep track of which chat hooks have subscribers, and which payload
+    fields the subscribers need.
+
+    Handlers decorated in this plugin, such as with `after_message_sent`,
+    are discovered from the skygear registry, and receive only the fields
+    named by their arguments. Hooks handled by other plugins cannot be
+    discovered and have to be listed in `external`, where '*' stands for
+    every hook; they are always sent, with all fields. Subscribers are
+    looked up again every `ttl` seconds.
+    """
+
+    def __init__(self, external=(), ttl=60, timer=time.monotonic):
+        self.external = set(external)
+        self.ttl = ttl
+        self.timer = timer
+        self._subscribers = {}
+        self._expires_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        func_map = get_registry().func_map['op']
+        subscribers = {}
+        for name in HOOK_NAMES:
+            if '*' in self.external or name in self.external:
+                subscribers[name] = ALL_FIELDS
+            elif name in func_map:
+                subscribers[name] = _accepted_fields(func_map[name])
+        with self._lock:
+            self._subscribers = subscribers
+            self._expires_at = self.timer() + self.ttl
+
+    def _get_subscribers(self):
+        with self._lock:
+            expired = self._expires_at is None or \
+                self._expires_at <= self.timer()
+        if expired:
+            self.refresh()
+        with self._lock:
+            return self._subscribers
+
+    def is_subscribed(self, name):
+        return name in self._get_subscribers()
+
+    def wants(self, name, field):
+        """
+        Return whether the subscribers of a hook need a payload field.
+        """
+        subscribers = self._get_subscribers()
+        if name not in subscribers:
+            return False
+        fields = subscribers[name]
+        return fields is ALL_FIELDS or field in fields
+
+
+def get_hook_registry():
+    global _hook_registry
+    with _hook_registry_lock:
+        if _hook_registry is None:
+            external = [name.strip()
+                        for name in settings.chat.external_hooks.split(',')
+                        if name.strip()]
+            _hook_registry = HookRegistry(
+                external=external,
+                ttl=settings.chat.hook_registry_ttl)
+    return _hook_registry
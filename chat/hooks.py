@@ -11,10 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-
+import threading
 
 from skygear.encoding import serialize_record
+from skygear.settings import settings
 
+from .cache import create_cache
 from .database import Database
 from .decorators import (AFTER_CONVERSATION_CREATED_HOOK,
                          AFTER_CONVERSATION_DELETED_HOOK,
@@ -24,89 +26,148 @@ from .decorators import (AFTER_CONVERSATION_CREATED_HOOK,
                          AFTER_USERS_ADDED_TO_CONVERSATION_HOOK,
                          AFTER_USERS_REMOVED_FROM_CONVERSATION_HOOK,
                          TYPING_STARTED_HOOK)
+from .hook_delivery import get_hook_delivery
+from .hook_registry import get_hook_registry
 from .predicate import Predicate
 from .query import Query
 from .utils import _get_container
 
-
-def __send_hook(name, params):
-    container = _get_container()
-    container.send_action(name, {'args': params})
-
-
-def __get_users_by_user_ids(user_ids):
-    container = _get_container()
-    database = Database(container, '')
-    predicate = Predicate(_id__in=user_ids)
-    query = Query('user', predicate=predicate, limit=10000)
-    users = database.query(query)
-    return [serialize_record(u) for u in users]
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = create_cache(settings.chat.user_cache_backend,
+                                       maxsize=settings.chat.user_cache_size,
+                                       ttl=settings.chat.user_cache_ttl)
+    return _user_cache
+
+
+def invalidate_users(user_ids):
+    get_user_cache().delete_many(user_ids)
+
+
+def get_users(user_ids):
+    """
+    Return the serialized user records of the given users, in the given
+    order. Users that do not exist are left out.
+
+    Serialized users are cached per user id; only the users missing from
+    the cache are looked up from the database. Hook handlers receiving
+    participant ids only can load the profiles they need with this.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    cache = get_user_cache()
+    users = cache.get_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in users]
+    if missing:
+        container = _get_container()
+        database = Database(container, '')
+        predicate = Predicate(_id__in=missing)
+        query = Query('user', predicate=predicate, limit=len(missing))
+        fetched = {u.id.key: serialize_record(u)
+                   for u in database.query(query)}
+        cache.set_many(fetched)
+        users.update(fetched)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def has_subscribers(name):
+    """
+    Return whether a chat hook has subscribers. Callers can skip building
+    the payload of hooks without subscribers.
+    """
+    return get_hook_registry().is_subscribed(name)
+
+
+def __send_hook(name, data, users=()):
+    """
+    Queue a chat hook with the payload fields its subscribers need.
+
+    `users` is a list of (key, ids_key, user_ids) tuples. The users are
+    added as serialized records under `key`, or as ids under `ids_key`
+    when hooks are configured to load user profiles themselves. Users are
+    only fetched when the subscribers need them, on the delivering thread.
+    Values of `data` can also be functions, which are called there too,
+    only when the subscribers need the field.
+    """
+    registry = get_hook_registry()
+    if not registry.is_subscribed(name):
+        return
+
+    def build_args():
+        args = {key: value() if callable(value) else value
+                for key, value in data.items()
+                if registry.wants(name, key)}
+        for key, ids_key, user_ids in users:
+            if settings.chat.hook_user_ids_only:
+                if registry.wants(name, ids_key):
+                    args[ids_key] = list(user_ids)
+            elif registry.wants(name, key):
+                args[key] = get_users(user_ids)
+        return args
+
+    get_hook_delivery().send(name, build_args)
 
 
 def send_after_message_sent_hook(message, conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    __send_hook(AFTER_MESSAGE_SENT_HOOK, {'message': message,
-                                          'conversation': conversation,
-                                          'participants': participants})
+    __send_hook(AFTER_MESSAGE_SENT_HOOK,
+                {'message': message, 'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_message_updated_hook(message, conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    __send_hook(AFTER_MESSAGE_UPDATED_HOOK, {'message': message,
-                                             'conversation': conversation,
-                                             'participants': participants})
+    __send_hook(AFTER_MESSAGE_UPDATED_HOOK,
+                {'message': message, 'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_message_deleted_hook(message, conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    __send_hook(AFTER_MESSAGE_DELETED_HOOK, {'message': message,
-                                             'conversation': conversation,
-                                             'participants': participants})
+    __send_hook(AFTER_MESSAGE_DELETED_HOOK,
+                {'message': message, 'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_typing_started_hook(conversation, participant_ids, events):
-    participants = __get_users_by_user_ids(participant_ids)
-    __send_hook(TYPING_STARTED_HOOK, {'conversation': conversation,
-                                      'participants': participants,
-                                      'events': events})
+    __send_hook(TYPING_STARTED_HOOK,
+                {'conversation': conversation, 'events': events},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_conversation_created_hook(conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    data = {'conversation': conversation, 'participants': participants}
-    __send_hook(AFTER_CONVERSATION_CREATED_HOOK, data)
+    __send_hook(AFTER_CONVERSATION_CREATED_HOOK,
+                {'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_conversation_updated_hook(conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    data = {'conversation': conversation, 'participants': participants}
-    __send_hook(AFTER_CONVERSATION_UPDATED_HOOK, data)
+    __send_hook(AFTER_CONVERSATION_UPDATED_HOOK,
+                {'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_conversation_deleted_hook(conversation, participant_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    data = {'conversation': conversation, 'participants': participants}
-    __send_hook(AFTER_CONVERSATION_DELETED_HOOK, data)
+    __send_hook(AFTER_CONVERSATION_DELETED_HOOK,
+                {'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids)])
 
 
 def send_after_users_added_to_conversation_hook(conversation,
                                                 participant_ids,
                                                 new_user_ids):
-
-    participants = __get_users_by_user_ids(participant_ids)
-    new_users = __get_users_by_user_ids(new_user_ids)
-    data = {'conversation': conversation,
-            'participants': participants,
-            'new_users': new_users}
-    __send_hook(AFTER_USERS_ADDED_TO_CONVERSATION_HOOK, data)
+    __send_hook(AFTER_USERS_ADDED_TO_CONVERSATION_HOOK,
+                {'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids),
+                 ('new_users', 'new_user_ids', new_user_ids)])
 
 
 def send_after_users_removed_from_conversation_hook(conversation,
                                                     participant_ids,
                                                     old_user_ids):
-    participants = __get_users_by_user_ids(participant_ids)
-    old_users = __get_users_by_user_ids(old_user_ids)
-    data = {'conversation': conversation,
-            'participants': participants,
-            'old_users': old_users}
-    __send_hook(AFTER_USERS_REMOVED_FROM_CONVERSATION_HOOK, data)
+    __send_hook(AFTER_USERS_REMOVED_FROM_CONVERSATION_HOOK,
+                {'conversation': conversation},
+                [('participants', 'participant_ids', participant_ids),
+                 ('old_users', 'old_user_ids', old_user_ids)])
@@ -12,19 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
+import logging
+import select
+import threading
+import time
+from collections import deque
 from urllib.parse import urlparse, urlunparse
 
+from websocket import ABNF, WebSocketException, create_connection
+
 from skygear.options import options
-from websocket import create_connection
+from skygear.settings import settings
 
 encoder = json.dumps
+logger = logging.getLogger(__name__)
+FRAMES_PER_WRITE = 100
+PUB_FRAME_TEMPLATE = '{"action": "pub", "channel": %s, "data": %s}'
 _hub = None
+_hub_lock = threading.Lock()
 
 
 def get_hub():
     global _hub
-    if not _hub:
-        _hub = Hub()
+    with _hub_lock:
+        if not _hub:
+            _hub = Hub(pool_size=settings.chat.pubsub_pool_size,
+                       max_idle=settings.chat.pubsub_max_idle)
     return _hub
 
 
@@ -45,27 +58,179 @@ def _get_default_pubsub_url():
     return urlunparse(urlparts)
 
 
+def _is_alive(conn):
+    """
+    Check whether an idle connection can still be written to.
+
+    The pubsub server never sends anything to a publisher except control
+    frames, so any pending pong is drained and a close frame or EOF marks
+    the connection as dead.
+    """
+    if not conn.connected or conn.sock is None:
+        return False
+    try:
+        while True:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+            if not readable:
+                return True
+            frame = conn.recv_frame()
+            if frame is None or frame.opcode == ABNF.OPCODE_CLOSE:
+                return False
+    except (WebSocketException, OSError, ValueError):
+        return False
+
+
+def _encode_pub_frames(channels, data):
+    """
+    Encode `pub` frames for every channel, serializing `data` only once.
+    """
+    payload = encoder(data)
+    return [PUB_FRAME_TEMPLATE % (encoder(channel), payload)
+            for channel in channels]
+
+
+def _format_frame(conn, text):
+    frame = ABNF.create_frame(text, ABNF.OPCODE_TEXT)
+    if conn.get_mask_key:
+        frame.get_mask_key = conn.get_mask_key
+    return frame.format()
+
+
+def _send_frames(conn, frames):
+    """
+    Write several text frames to the connection with a single send.
+    """
+    data = b''.join(_format_frame(conn, frame) for frame in frames)
+    with conn.lock:
+        conn.sock.sendall(data)
+
+
+def _close(conn):
+    try:
+        conn.close(timeout=0)
+    except (WebSocketException, OSError):
+        pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of websocket connections to the pubsub endpoint.
+
+    At most `size` idle connections are kept open. Connections idle for
+    longer than `max_idle` seconds, or found closed by the server, are
+    discarded on checkout and replaced with a new connection.
+    """
+
+    def __init__(self, end_point, header=None, size=4, max_idle=60,
+                 timeout=10):
+        self.end_point = end_point
+        self.header = header
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        wsopts = {}
+        if self.header:
+            wsopts['header'] = self.header
+        return create_connection(self.end_point,
+                                 timeout=self.timeout,
+                                 **wsopts)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used <= self.max_idle and \
+                    _is_alive(conn):
+                return conn
+            _close(conn)
+        return self._connect()
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        _close(conn)
+
+    def discard(self, conn):
+        _close(conn)
+
+    def close(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            _close(conn)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle)
+
+
 class Hub:
 
-    def __init__(self, end_point=None, api_key=None):
+    def __init__(self, end_point=None, api_key=None, pool_size=None,
+                 max_idle=None):
         self.transport = 'websocket'
         self.end_point = end_point or _get_default_pubsub_url()
         self.api_key = api_key or options.apikey
+        header = None
+        if self.api_key:
+            header = ['X-Skygear-API-Key: {0}'.format(self.api_key)]
+        self.pool = ConnectionPool(self.end_point, header=header)
+        if pool_size is not None:
+            self.pool.size = pool_size
+        if max_idle is not None:
+            self.pool.max_idle = max_idle
 
     def publish(self, channels, data):
-        wsopts = {}
-        if self.api_key:
-            wsopts['header'] = [
-                    'X-Skygear-API-Key: {0}'.format(self.api_key)
-                    ]
-        conn = create_connection(self.end_point, **wsopts)
         if isinstance(channels, str):
             channels = [channels]
-        for channel in channels:
-            _data = encoder({
-                'action': 'pub',
-                'channel': channel,
-                'data': data,
-            })
-            conn.send(_data)
-        conn.close()
+        self._send(_encode_pub_frames(channels, data))
+
+    def publish_many(self, channels, datas):
+        """
+        Publish several payloads to the same channels over one connection.
+        Each payload is still delivered as its own pub frame.
+        """
+        if isinstance(channels, str):
+            channels = [channels]
+        frames = []
+        for data in datas:
+            frames += _encode_pub_frames(channels, data)
+        self._send(frames)
+
+    def _send(self, frames):
+        """
+        Send frames over a pooled connection in batches of
+        FRAMES_PER_WRITE, reconnecting once if the connection turns out to
+        be broken half-way.
+        """
+        batches = [frames[i:i + FRAMES_PER_WRITE]
+                   for i in range(0, len(frames), FRAMES_PER_WRITE)]
+        conn = self.pool.acquire()
+        sent = 0
+        try:
+            for batch in batches:
+                _send_frames(conn, batch)
+                sent += 1
+        except (WebSocketException, OSError):
+            logger.warning('pubsub connection broken, reconnecting')
+            self.pool.discard(conn)
+            conn = self.pool.acquire()
+            try:
+                for batch in batches[sent:]:
+                    _send_frames(conn, batch)
+            except (WebSocketException, OSError):
+                self.pool.discard(conn)
+                raise
+        self.pool.release(conn)
+
+    def close(self):
+        self.pool.close()
@@ -7,6 +7,7 @@ from skygear.utils import db
 
 from .field import Field
 from .schema import Schema, SchemaHelper
+from .user_conversation import update_participant_summary
 from .utils import _get_schema_name
 
 
@@ -23,7 +24,8 @@ def register_initialization_event_handlers(settings):
                 Field('edited_at', 'datetime')]
 
     def _message_schema():
-        fields = _base_message_fields() + [Field('deleted', 'boolean')]
+        fields = _base_message_fields() + [Field('deleted', 'boolean'),
+                                           Field('read_count', 'number')]
         return Schema('message', fields)
 
     def _message_history_schema():
@@ -48,7 +50,10 @@ def register_initialization_event_handlers(settings):
                                       Field('deleted', 'boolean'),
                                       Field('distinct_by_participants',
                                             'boolean'),
-                                      Field('last_message', 'ref(message)')])
+                                      Field('last_message', 'ref(message)'),
+                                      Field('participant_count', 'number'),
+                                      Field('participant_hash', 'string'),
+                                      Field('membership_version', 'number')])
         user_schema = Schema('user', [Field('name', 'string')])
         user_conversation_schema = Schema('user_conversation',
                                           [Field('user', 'ref(user)'),
@@ -78,6 +83,35 @@ def register_initialization_event_handlers(settings):
                               user_channel_schema],
                              plugin_request=True)
 
+        # Backfill the counters that message status is derived from. Only
+        # rows created before the counters were introduced are touched.
+        with db.conn() as conn:
+            conn.execute("""
+                UPDATE %(schema_name)s.message m
+                SET read_count = (
+                    SELECT COUNT(*)
+                    FROM %(schema_name)s.receipt r
+                    WHERE r.message = m._id AND r.read_at IS NOT NULL
+                )
+                WHERE m.read_count IS NULL
+                """, {
+                    'schema_name': AsIs(_get_schema_name())
+                })
+            cur = conn.execute("""
+                SELECT _id
+                FROM %(schema_name)s.conversation
+                WHERE participant_count IS NULL OR participant_hash IS NULL
+                """, {
+                    'schema_name': AsIs(_get_schema_name())
+                })
+            update_participant_summary(conn, [row[0] for row in cur])
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS conversation_participant_hash_idx
+                ON %(schema_name)s.conversation (participant_hash)
+                """, {
+                    'schema_name': AsIs(_get_schema_name())
+                })
+
         # Create unique constraint to _database_id in user_channel table
         # to ensure there is only one user_channel for each user
         with db.conn() as conn:
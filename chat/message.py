@@ -4,7 +4,7 @@ from skygear.utils import db
 
 from .exc import AlreadyDeletedException
 from .predicate import Predicate
-from .pubsub import _publish_record_event
+from .pubsub import _publish_record_event, _publish_record_events
 from .query import Query
 from .record import ChatRecord
 from .user_conversation import UserConversation
@@ -58,86 +58,208 @@ class Message(ChatRecord):
         Update the message status field by querying the database for
         all receipt statuses.
         """
+        Message.update_all_message_status(conn, [self])
+
+    @classmethod
+    def update_all_message_status(cls, conn, messages) -> None:
+        """
+        Update the message status field of many messages at once. The
+        status is derived from the read count maintained on each message
+        and the participant count maintained on its conversation.
+        """
+        if len(messages) == 0:
+            return
         cur = conn.execute('''
-            WITH
-              read_count AS (
-                SELECT DISTINCT COUNT(receipt.user) as count
-                FROM %(schema_name)s.receipt
-                WHERE message = %(message_id)s
-                    AND read_at IS NOT NULL
-              ),
-              participant_count AS (
-                SELECT count(1) as count
-                FROM %(schema_name)s.user_conversation
-                WHERE conversation = %(conversation_id)s
-              )
-            UPDATE %(schema_name)s.message
+            UPDATE %(schema_name)s.message m
             SET _updated_at = NOW(),
-                message_status =
-                  CASE
-                    WHEN read_count.count = 0 THEN 'delivered'
-                    WHEN read_count.count < participant_count.count
+                message_status = CASE
+                    WHEN COALESCE(m.read_count, 0) = 0 THEN 'delivered'
+                    WHEN m.read_count < COALESCE(c.participant_count, 0)
                         THEN 'some_read'
                     ELSE 'all_read'
-                  END
-            FROM read_count, participant_count
-            WHERE _id = %(message_id)s
-            RETURNING _updated_at, message_status
+                END
+            FROM %(schema_name)s.conversation c
+            WHERE c._id = m.conversation
+                AND m._id = ANY(%(message_ids)s)
+            RETURNING m._id, m._updated_at, m.message_status
             ''', {
                 'schema_name': AsIs(_get_schema_name()),
-                'message_id': self.id.key,
-                'conversation_id': self.conversation_id
+                'message_ids': [message.id.key for message in messages]
             }
         )
 
-        row = cur.fetchone()
-        if row is not None:
-            self['_updated_at'] = row[0]
-            self['message_status'] = row[1]
+        messages_by_id = {message.id.key: message for message in messages}
+        for row in cur:
+            message = messages_by_id[row[0]]
+            message['_updated_at'] = row[1]
+            message['message_status'] = row[2]
 
     def notifyParticipants(self, event_type='update') -> None:
-        result = UserConversation.\
-            fetch_all_by_conversation_id(self.conversation_id)
-        participants = [row['user'].recordID.key for row in result]
+        participants = UserConversation.fetch_participant_ids(
+            [self.conversation_id])[self.conversation_id]
         _publish_record_event(participants,
                               "message",
                               event_type,
                               self)
 
+    @classmethod
+    def notify_all_participants(cls, messages, event_type='update') -> None:
+        """
+        Notify participants of many messages. Participants are looked up
+        once for all conversations, and the events of each conversation
+        are published to its participants in one batch.
+        """
+        messages_by_conversation = {}
+        for message in messages:
+            messages_by_conversation\
+                .setdefault(message.conversation_id, [])\
+                .append(message)
+        participants = UserConversation.fetch_participant_ids(
+            list(messages_by_conversation.keys()))
+        for conversation_id, conversation_messages in \
+                messages_by_conversation.items():
+            _publish_record_events(participants.get(conversation_id, []),
+                                   "message",
+                                   event_type,
+                                   conversation_messages)
+
     @property
     def conversation_id(self):
         return self['conversation'].recordID.key
 
     @classmethod
-    def fetch_all_by_conversation_id(cls, conversation_id, limit,
-                                     before_time=None, before_message_id=None,
-                                     after_time=None, after_message_id=None,
-                                     order=None, deleted=False):
-        database = cls._get_database()
-        predicate = Predicate(conversation__eq=conversation_id,
-                              deleted__eq=deleted)
+    def resolve_range(cls, conn, conversation_id, user_id,
+                      before_message_id=None, after_message_id=None):
+        """
+        Check that the user participates in the conversation and look up
+        the seq of the range boundary messages in a single statement.
+
+        Returns a tuple of the membership flag and the seqs of the before
+        and after messages, which are None when the message is not given
+        or not found in the conversation.
+        """
+        cur = conn.execute('''
+            SELECT
+                EXISTS (
+                    SELECT 1
+                    FROM %(schema_name)s.user_conversation
+                    WHERE "user" = %(user_id)s
+                        AND conversation = %(conversation_id)s
+                ),
+                (
+                    SELECT seq
+                    FROM %(schema_name)s.message
+                    WHERE _id = %(before_message_id)s
+                        AND conversation = %(conversation_id)s
+                ),
+                (
+                    SELECT seq
+                    FROM %(schema_name)s.message
+                    WHERE _id = %(after_message_id)s
+                        AND conversation = %(conversation_id)s
+                )
+            ''', {
+                'schema_name': AsIs(_get_schema_name()),
+                'user_id': user_id,
+                'conversation_id': conversation_id,
+                'before_message_id': before_message_id,
+                'after_message_id': after_message_id
+            }
+        )
+        return tuple(cur.first())
+
+    @classmethod
+    def __range_predicate(cls, conversation_id,
+                          before_time=None, before_seq=None,
+                          after_time=None, after_seq=None):
+        predicate = Predicate(conversation__eq=conversation_id)
         if before_time is not None:
             predicate = predicate & Predicate(_created_at__lt=before_time)
-        if before_message_id is not None:
-            before_message = Message.fetch_one(before_message_id)
-            predicate = predicate & Predicate(seq__lt=before_message['seq'])
+        if before_seq is not None:
+            predicate = predicate & Predicate(seq__lt=before_seq)
         if after_time is not None:
             predicate = predicate & Predicate(_created_at__gt=after_time)
-        if after_message_id is not None:
-            after_message = Message.fetch_one(after_message_id)
-            predicate = predicate & Predicate(seq__gt=after_message['seq'])
+        if after_seq is not None:
+            predicate = predicate & Predicate(seq__gt=after_seq)
+        return predicate
+
+    @classmethod
+    def __query_range(cls, predicate, limit, order):
+        database = cls._get_database()
         query = Query('message', predicate=predicate, limit=limit)
-        if order != 'edited_at':
-            order = '_created_at'
         query.add_order(order, 'desc')
-        result = database.query(query)
-
-        # remove deleted message content
-        if deleted:
-            for message in result:
-                if message['deleted']:
-                    Message.clear_message_content(message)
-        return result
+        query.add_order('_id', 'desc')
+        return database.query(query)
+
+    @staticmethod
+    def __order_key(order):
+        return 'edited_at' if order == 'edited_at' else '_created_at'
+
+    @staticmethod
+    def __order_value(message, order):
+        if order == '_created_at':
+            return message.created_at
+        return message.get(order)
+
+    @classmethod
+    def __after_row(cls, row, order):
+        """
+        Return the predicate of the messages that come after `row` in the
+        descending page order, in which ties are broken by id and missing
+        values come first.
+        """
+        value = cls.__order_value(row, order)
+        is_null = Predicate(**{order + '__eq': None})
+        same_value_after = Predicate(_id__lt=row.id.key)
+        if value is None:
+            return (is_null & same_value_after) | ~is_null
+        return Predicate(**{order + '__lt': value}) | \
+            (Predicate(**{order + '__eq': value}) & same_value_after)
+
+    @classmethod
+    def fetch_page_by_conversation_id(cls, conversation_id, limit,
+                                      before_time=None, before_seq=None,
+                                      after_time=None, after_seq=None,
+                                      order=None, deleted_limit=100):
+        """
+        Fetch the latest `limit` messages in the range, together with the
+        deleted messages in the window of the returned page.
+
+        The window spans from the upper end of the range down to the
+        oldest returned message, or to the lower end of the range when
+        fewer than `limit` messages are left. Live and deleted messages are
+        read together, `limit + deleted_limit` rows per query, so a window
+        holding up to `deleted_limit` deleted messages costs one query.
+        Windows holding more deleted messages are read on with further
+        queries, so that no deleted message is skipped by paging. Deleted
+        messages are returned with their content cleared.
+        """
+        order = cls.__order_key(order)
+        predicate = cls.__range_predicate(conversation_id,
+                                          before_time, before_seq,
+                                          after_time, after_seq)
+        batch_size = limit + deleted_limit
+        messages = []
+        deleted = []
+        rows_predicate = predicate
+        while True:
+            rows = cls.__query_range(rows_predicate, batch_size, order)
+            for row in rows:
+                if len(messages) == limit:
+                    break
+                # like deleted__eq conditions, rows without the flag are
+                # neither live nor deleted
+                if row.get('deleted') is True:
+                    deleted.append(row)
+                elif row.get('deleted') is False:
+                    messages.append(row)
+            if len(messages) == limit or len(rows) < batch_size:
+                break
+            rows_predicate = predicate & cls.__after_row(rows[-1], order)
+
+        for message in deleted:
+            Message.clear_message_content(message)
+        return messages, deleted
 
     @classmethod
     def fetch_all_by_conversation_id_and_seq(cls,
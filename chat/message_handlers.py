@@ -5,16 +5,18 @@ from psycopg2.extensions import AsIs
 import skygear
 from skygear.encoding import serialize_record
 from skygear.models import RecordID, Reference
+from skygear.settings import settings
 from skygear.utils import db
 from skygear.utils.context import current_user_id
 
 from .asset import sign_asset_url
 from .conversation import Conversation
+from .decorators import AFTER_MESSAGE_SENT_HOOK, AFTER_MESSAGE_UPDATED_HOOK
 from .exc import (AlreadyDeletedException, ConversationNotFoundException,
                   InvalidGetMessagesConditionArgumentException,
                   MessageNotFoundException, NotInConversationException,
                   NotSupportedException)
-from .hooks import (send_after_message_deleted_hook,
+from .hooks import (has_subscribers, send_after_message_deleted_hook,
                     send_after_message_sent_hook,
                     send_after_message_updated_hook)
 from .message import Message
@@ -32,99 +34,50 @@ def __serialize_message_record(message):
     return output
 
 
+def __resolve_range(conversation_id, before_message_id, after_message_id):
+    """
+    Check that the current user is in the conversation and return the seq
+    of the boundary messages, resolved with one statement instead of
+    fetching the conversation and messages.
+    """
+    with db.conn() as conn:
+        is_member, before_seq, after_seq = Message.resolve_range(
+            conn, conversation_id, current_user_id(),
+            before_message_id, after_message_id)
+    if not is_member:
+        raise ConversationNotFoundException()
+    if (before_message_id and before_seq is None) or \
+            (after_message_id and after_seq is None):
+        raise MessageNotFoundException()
+    return before_seq, after_seq
+
+
 def get_messages(conversation_id, limit,
                  before_time=None, before_message_id=None,
                  after_time=None, after_message_id=None,
                  order=None):
-    if not Conversation.exists(conversation_id):
-        raise ConversationNotFoundException()
-
     # use message id if given message id as the range condition,
     # otherwise use time as range condition
     #
     # thus if neither message id or time is given, this will return the
     # latest messages
-    if before_message_id or after_message_id:
-        if before_time or after_time:
-            raise InvalidGetMessagesConditionArgumentException()
-
-        return get_messages_by_message(conversation_id, limit,
-                                       before_message_id, after_message_id,
-                                       order)
-    else:
-        return get_messages_by_time(conversation_id, limit,
-                                    before_time, after_time, order)
-
-
-def get_messages_by_message(conversation_id, limit,
-                            before_message_id=None, after_message_id=None,
-                            order=None):
-    output = {}
-    messages = Message.fetch_all_by_conversation_id(
-               conversation_id, limit,
-               before_message_id=before_message_id,
-               after_message_id=after_message_id,
-               order=order)
-    output['results'] = [serialize_record(message) for message in messages]
-
-    # include deleted messages in a separate array
-    no_limit = 999999
-
-    if len(messages) > 0:
-        # if not given both before and after message id
-        # assume it is getting latest messages
-        #
-        # so it does not set before_message_id
-        # because we want to get latest deleted messages
-        if not after_message_id:
-            after_message_id = messages[len(messages) - 1].id.key
-        elif not before_message_id:
-            before_message_id = messages[0].id.key
-
-    deleted_messages = Message.fetch_all_by_conversation_id(
-        conversation_id, no_limit,
-        before_message_id=before_message_id,
-        after_message_id=after_message_id,
-        order=order, deleted=True
-    )
-    output['deleted'] = \
-        [serialize_record(message) for message in deleted_messages]
-
-    return output
-
-
-def get_messages_by_time(conversation_id, limit,
-                         before_time=None, after_time=None, order=None):
-    output = {}
-    messages = Message.fetch_all_by_conversation_id(
-               conversation_id, limit,
-               before_time=before_time, after_time=after_time, order=order)
-    serialized_messages = [serialize_record(message) for message in messages]
-    output['results'] = serialized_messages
-
-    # include deleted messages in a separate array
-    no_limit = 999999
-
-    if len(messages) > 0:
-        # if not given both before and after time
-        # assume it is getting latest messages
-        #
-        # so it does not set before_time
-        # because we want to get latest deleted messages
-        if not after_time:
-            after_time = serialized_messages[len(messages) - 1]['_created_at']
-        elif not before_time:
-            before_time = serialized_messages[0]['_created_at']
-
-    deleted_messages = Message.fetch_all_by_conversation_id(
-        conversation_id, no_limit,
-        before_time=before_time, after_time=after_time, order=order,
-        deleted=True
-    )
-    output['deleted'] = \
-        [serialize_record(message) for message in deleted_messages]
-
-    return output
+    by_message = before_message_id or after_message_id
+    if by_message and (before_time or after_time):
+        raise InvalidGetMessagesConditionArgumentException()
+
+    before_seq, after_seq = __resolve_range(
+        conversation_id, before_message_id, after_message_id)
+    messages, deleted_messages = Message.fetch_page_by_conversation_id(
+        conversation_id, limit,
+        before_time=before_time, before_seq=before_seq,
+        after_time=after_time, after_seq=after_seq,
+        order=order,
+        deleted_limit=settings.chat.get_messages_deleted_limit)
+    return {
+        'results': [serialize_record(message) for message in messages],
+        'deleted': [serialize_record(message)
+                    for message in deleted_messages]
+    }
 
 
 def handle_message_before_save(record, original_record, conn):
@@ -139,7 +92,11 @@ def handle_message_before_save(record, original_record, conn):
     if original_record is None:
         message['deleted'] = False
         message['revision'] = 1
+        message['read_count'] = 0
     else:
+        # read_count is maintained by receipts, never by the client
+        if 'read_count' in message:
+            del message['read_count']
         message_history = MessageHistory(Message.from_record(original_record))
         message_history.save()
     message['edited_at'] = datetime.utcnow()
@@ -210,6 +167,10 @@ def handle_message_after_save(record, original_record, conn):
 
     # notify participants after conversation and user_conversation updated
     message.notifyParticipants(event_type)
+    hook = AFTER_MESSAGE_SENT_HOOK if original_record is None \
+        else AFTER_MESSAGE_UPDATED_HOOK
+    if not has_subscribers(hook):
+        return
     conversation = serialize_record(Conversation.fetch_one(conversation_id))
     serialized_message = __serialize_message_record(record)
     participant_ids = conversation['participant_ids']
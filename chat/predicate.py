@@ -16,6 +16,8 @@
 import collections
 import copy
 
+from skygear.encoding import serialize_value
+
 
 class Predicate(object):
     AND = 'and'
@@ -61,7 +63,7 @@ class Predicate(object):
     @classmethod
     def condition_to_dict(cls, t):
         field, op = t[0].split("__")
-        return [op, {"$type": "keypath", "$val": field}, t[1]]
+        return [op, {"$type": "keypath", "$val": field}, serialize_value(t[1])]
 
     def to_dict(self, root=None):
         if root is None:
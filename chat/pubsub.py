@@ -1,20 +1,59 @@
-from skygear.models import Record
-from skygear.options import options as skyoptions
+from skygear.models import Record, Reference
 
+from .dispatcher import get_dispatcher
 from .encoding import serialize_record
-from .hub import Hub
+from .hub import get_hub
 from .utils import _get_channels_by_user_ids
 
 
-def _publish_event(user_ids: [], event: str, data: dict = None) -> None:
+def _ordering_key(record: Record) -> str:
+    """
+    Return the key that events of a record are delivered in order by,
+    which is the conversation the record belongs to.
+    """
+    conversation = record.get('conversation') \
+        if record.id.type != 'conversation' else None
+    if isinstance(conversation, Reference):
+        return conversation.recordID.key
+    return record.id.key
+
+
+def _publish_event(user_ids: [], event: str, data: dict = None,
+                   key: str = None) -> None:
+    """
+    Queue an event for the user channels of the given users. Channel
+    lookup and delivery happen on the dispatcher threads. Events with the
+    same `key` are delivered in order; without a key, events to the same
+    users are.
+    """
     if not isinstance(user_ids, list):
         user_ids = user_ids
     if len(user_ids) == 0:
         return
+    if key is None:
+        key = tuple(sorted(user_ids))
+    get_dispatcher().submit_ordered(key, _deliver_event, user_ids, event,
+                                    data)
+
+
+def _publish_channel_event(channel_names: [], event: str,
+                           data: dict = None, key: str = None) -> None:
+    """
+    Queue an event for channels that are already resolved. Events with
+    the same `key` are delivered in order.
+    """
+    if len(channel_names) == 0:
+        return
+    get_dispatcher().submit_ordered(key, get_hub().publish, channel_names, {
+        'event': event,
+        'data': data
+    })
+
+
+def _deliver_event(user_ids: [], event: str, data: dict = None) -> None:
     channel_names = _get_channels_by_user_ids(user_ids)
     if channel_names:
-        hub = Hub(api_key=skyoptions.apikey)
-        hub.publish(channel_names, {
+        get_hub().publish(channel_names, {
             'event': event,
             'data': data
         })
@@ -31,4 +70,33 @@ def _publish_record_event(user_ids: [],
         'type': 'record',
         'record_type': record_type,
         'record': serialize_record(record)
-    })
+    }, key=_ordering_key(record))
+
+
+def _publish_record_events(user_ids: [],
+                           record_type: str,
+                           event: str,
+                           records: [Record]) -> None:
+    """
+    Publish events of several records to the same users. Channels are
+    looked up once and all events are sent in one batch.
+    """
+    if len(user_ids) == 0 or len(records) == 0:
+        return
+    payloads = [{
+        'event': event,
+        'data': {
+            'event_type': event,
+            'type': 'record',
+            'record_type': record_type,
+            'record': serialize_record(record)
+        }
+    } for record in records]
+    get_dispatcher().submit_ordered(_ordering_key(records[0]),
+                                    _deliver_events, user_ids, payloads)
+
+
+def _deliver_events(user_ids: [], payloads: [dict]) -> None:
+    channel_names = _get_channels_by_user_ids(user_ids)
+    if channel_names:
+        get_hub().publish_many(channel_names, payloads)
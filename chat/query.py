@@ -18,7 +18,7 @@ from .predicate import Predicate
 class Query:
     def __init__(self, record_type,
                  predicate=None, count=False,
-                 limit=50, offset=None, include=[]):
+                 limit=50, offset=None, include=[], direct=None):
         self.record_type = record_type
         if predicate is None:
             predicate = Predicate()
@@ -28,6 +28,9 @@ class Query:
         self.limit = limit
         self.offset = offset
         self.include = include
+        # read from the database directly instead of the container, None
+        # follows the SKYGEAR_CHAT_DIRECT_READ setting
+        self.direct = direct
 
     def add_order(self, key, order):
         self.sort.append([{'$type': 'keypath', '$val': key}, order])
@@ -2,9 +2,12 @@ import hashlib
 import uuid
 from datetime import datetime
 
+from psycopg2.extensions import AsIs
+
 from skygear.models import RecordID, Reference
 
 from .record import ChatRecord
+from .utils import _get_schema_name
 
 
 class Receipt(ChatRecord):
@@ -35,6 +38,35 @@ class Receipt(ChatRecord):
         sha = hashlib.sha256(bytes(seed, 'utf8'))
         return str(uuid.UUID(bytes=sha.digest()[0:16]))
 
+    @classmethod
+    def create_all(cls, conn, user_id: str, message_ids: [str]) -> None:
+        """
+        Create the user's receipts of the messages in one statement,
+        skipping receipts that already exist.
+        """
+        if len(message_ids) == 0:
+            return
+        conn.execute('''
+            INSERT INTO %(schema_name)s.receipt (
+                _id, _database_id, _owner_id, _access,
+                _created_at, _created_by, _updated_at, _updated_by,
+                "user", message
+            )
+            SELECT receipt_id, '', %(user_id)s, NULL,
+                   NOW(), %(user_id)s, NOW(), %(user_id)s,
+                   %(user_id)s, message_id
+            FROM unnest(%(receipt_ids)s::text[], %(message_ids)s::text[])
+                AS t(receipt_id, message_id)
+            ON CONFLICT (_id) DO NOTHING
+            ''', {
+                'schema_name': AsIs(_get_schema_name()),
+                'user_id': user_id,
+                'receipt_ids': [cls.consistent_id(user_id, message_id)
+                                for message_id in message_ids],
+                'message_ids': list(message_ids)
+            }
+        )
+
     def mark_as_delivered(self) -> None:
         self[Receipt.DELIVERED_AT] = datetime.utcnow()
 
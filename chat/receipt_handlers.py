@@ -71,14 +71,18 @@ def handle_mark_as_read_by_range(from_message_id, to_message_id):
     messages_to_be_marked = Message.\
         fetch_all_by_conversation_id_and_seq(
                             conversation_id, from_seq, to_seq)
-    mark_messages(messages_to_be_marked, True, True)
+    mark_messages([message.id.key for message in messages_to_be_marked],
+                  True, True)
 
 
 def __validate_current_user_in_messages(messages, user_id):
-    for message in messages:
-        if UserConversation.fetch_one(message.conversation_id,
-                                      user_id=user_id) is None:
-            raise NotInConversationException()
+    conversation_ids = {message.conversation_id for message in messages}
+    keys = [UserConversation.get_consistent_hash(conversation_id, user_id)
+            for conversation_id in conversation_ids]
+    if len(keys) == 0:
+        return
+    if len(UserConversation.fetch_all(keys)) != len(keys):
+        raise NotInConversationException()
 
 
 def mark_messages(message_ids, mark_delivered, mark_read):
@@ -89,150 +93,137 @@ def mark_messages(message_ids, mark_delivered, mark_read):
     user_id = current_user_id()
     messages = Message.fetch_all(message_ids)
     __validate_current_user_in_messages(messages, user_id)
+    message_ids = [message.id.key for message in messages]
 
     new_message_ids = []
 
-    receipts = [Receipt.new(current_user_id(), message_id)
-                for message_id in message_ids]
-    Receipt.save_all(receipts)
+    with db.conn() as conn:
+        Receipt.create_all(conn, user_id, message_ids)
 
-    if mark_delivered:
-        new_message_ids += mark_messages_as_delivered(message_ids)
+        if mark_delivered:
+            new_message_ids += mark_messages_as_delivered(conn, message_ids)
 
-    if mark_read:
-        new_message_ids += mark_messages_as_read(message_ids)
+        if mark_read:
+            new_message_ids += mark_messages_as_read(conn, messages)
 
     new_message_ids = list(set(new_message_ids))
 
     __update_and_notify_messages(new_message_ids)
 
 
-def mark_messages_as_delivered(message_ids):
-    undelivered_messages = []
-    schema_name = AsIs(_get_schema_name())
-    user_id = current_user_id()
-    with db.conn() as conn:
-        for message_id in message_ids:
-            cur = conn.execute('''
-                WITH undelivered_receipt AS (
-                    SELECT r._id AS _id, r.message AS message_id
-                    FROM %(schema_name)s.receipt r
-                    WHERE r.message = %(message_id)s
-                    AND r.user = %(user_id)s
-                    AND delivered_at IS NULL LIMIT 1
-                ),
-                update_delivered_at AS (
-                    UPDATE %(schema_name)s.receipt
-                    SET delivered_at = NOW()
-                    FROM undelivered_receipt
-                    WHERE receipt._id = undelivered_receipt._id
-                )
-                SELECT message_id
-                FROM undelivered_receipt
-                ''', {
-                    'schema_name': schema_name,
-                    'user_id': user_id,
-                    'message_id': message_id
-            })
-            row = cur.fetchone()
-            if row is not None:
-                undelivered_messages.append(row[0])
-    return undelivered_messages
-
-
-def mark_messages_as_read(message_ids):
+def mark_messages_as_delivered(conn, message_ids):
+    """
+    Mark the current user's undelivered receipts of the messages as
+    delivered with one statement, returning the affected message ids.
+    """
+    cur = conn.execute('''
+        UPDATE %(schema_name)s.receipt
+        SET delivered_at = NOW()
+        WHERE message = ANY(%(message_ids)s)
+        AND "user" = %(user_id)s
+        AND delivered_at IS NULL
+        RETURNING message
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'user_id': current_user_id(),
+            'message_ids': list(message_ids)
+    })
+    return [row[0] for row in cur]
+
+
+def mark_messages_as_read(conn, messages):
+    """
+    Mark the current user's receipts of the messages as read.
+
+    Receipts of each conversation are updated with one statement, which
+    also advances last_read_message to the newest newly-read message and
+    subtracts the number of newly-read messages from unread_count.
+    """
     schema_name = AsIs(_get_schema_name())
     user_id = current_user_id()
     unread_message_ids = []
 
-    with db.conn() as conn:
-        for message_id in message_ids:
-            cur = conn.execute('''
-                WITH unread_receipt AS (
-                    SELECT r._id AS _id, r.message AS message_id
-                    FROM %(schema_name)s.receipt r
-                    WHERE r.message = %(message_id)s
-                    AND r.user = %(user_id)s
-                    AND read_at IS NULL LIMIT 1
-                ),
-                this_message AS (
-                    SELECT message.conversation, message.seq, message._id
-                    FROM %(schema_name)s.message, unread_receipt
-                    WHERE message._id = unread_receipt.message_id
-                    LIMIT 1
-                ),
-                last_read_message AS(
-                    SELECT last_read_message AS _id
-                    FROM %(schema_name)s.user_conversation uc,
-                         this_message
-                    WHERE uc.user = %(user_id)s
-                    AND uc.conversation = this_message.conversation
-                    LIMIT 1
-                )
-                ,last_read_message_seq AS (
-                    SELECT message.seq
-                    FROM %(schema_name)s.message,
-                         last_read_message
-                    WHERE message._id = last_read_message._id
-                    LIMIT 1
-                ),
-                update_last_read_message AS (
-                    UPDATE %(schema_name)s.user_conversation uc
-                    SET last_read_message =
-                    CASE WHEN
-                        this_message.seq > last_read_message_seq.seq
-                    THEN
-                        this_message._id
-                    ELSE
-                        last_read_message._id
-                    END
-                    FROM this_message,
-                         last_read_message_seq,
-                         last_read_message
-                    WHERE uc.user = %(user_id)s
-                    AND uc.conversation = this_message.conversation
-                ),
-                update_read_at AS (
-                    UPDATE %(schema_name)s.receipt
-                    SET read_at = NOW()
-                    FROM unread_receipt
-                    WHERE receipt._id = unread_receipt._id
-                ),
-                update_unread_count AS (
-                    UPDATE %(schema_name)s.user_conversation uc
-                    SET unread_count =
-                    CASE WHEN
-                        unread_count <= 0
-                    THEN
-                        0
-                    ELSE
-                        unread_count - 1
-                    END
-                    FROM unread_receipt,
-                         this_message
-                    WHERE uc.user = %(user_id)s
-                    AND uc.conversation = this_message.conversation
-                )
-                SELECT message_id
+    message_ids_by_conversation = {}
+    for message in messages:
+        message_ids_by_conversation\
+            .setdefault(message.conversation_id, [])\
+            .append(message.id.key)
+
+    for conversation_id, message_ids in message_ids_by_conversation.items():
+        cur = conn.execute('''
+            WITH unread_receipt AS (
+                SELECT r._id AS _id, m._id AS message_id, m.seq AS seq
+                FROM %(schema_name)s.receipt r
+                JOIN %(schema_name)s.message m ON m._id = r.message
+                WHERE r.message = ANY(%(message_ids)s)
+                AND r.user = %(user_id)s
+                AND m.conversation = %(conversation_id)s
+                AND r.read_at IS NULL
+                FOR UPDATE OF r
+            ),
+            update_read_at AS (
+                UPDATE %(schema_name)s.receipt
+                SET read_at = NOW()
+                FROM unread_receipt
+                WHERE receipt._id = unread_receipt._id
+            ),
+            update_read_count AS (
+                UPDATE %(schema_name)s.message
+                SET read_count = COALESCE(read_count, 0) + 1
                 FROM unread_receipt
-            ''', {
-                'schema_name': schema_name,
-                'user_id': user_id,
-                'message_id': message_id
-            })
-            row = cur.fetchone()
-            if row is not None:
-                unread_message_ids.append(row[0])
+                WHERE message._id = unread_receipt.message_id
+            ),
+            newest_unread_message AS (
+                SELECT message_id AS _id, seq
+                FROM unread_receipt
+                ORDER BY seq DESC
+                LIMIT 1
+            ),
+            update_user_conversation AS (
+                UPDATE %(schema_name)s.user_conversation uc
+                SET last_read_message =
+                CASE WHEN
+                    COALESCE((
+                        SELECT m.seq
+                        FROM %(schema_name)s.message m
+                        WHERE m._id = uc.last_read_message
+                    ), -1) < newest_unread_message.seq
+                THEN
+                    newest_unread_message._id
+                ELSE
+                    uc.last_read_message
+                END,
+                unread_count = GREATEST(
+                    uc.unread_count -
+                    (SELECT COUNT(*) FROM unread_receipt),
+                    0
+                )
+                FROM newest_unread_message
+                WHERE uc.user = %(user_id)s
+                AND uc.conversation = %(conversation_id)s
+            )
+            SELECT message_id
+            FROM unread_receipt
+        ''', {
+            'schema_name': schema_name,
+            'user_id': user_id,
+            'conversation_id': conversation_id,
+            'message_ids': message_ids
+        })
+        unread_message_ids += [row[0] for row in cur]
 
     return unread_message_ids
 
 
 def __update_and_notify_messages(message_ids):
+    if len(message_ids) == 0:
+        return
+    # read counts were changed with SQL
+    Message.forget(message_ids)
     messages = Message.fetch_all(message_ids)
     with db.conn() as conn:
-        for message in messages:
-            message.updateMessageStatus(conn)
-            message.notifyParticipants()
+        Message.update_all_message_status(conn, messages)
+    Message.notify_all_participants(messages)
 
 
 def handle_get_receipt(message_id):
@@ -1,9 +1,11 @@
+import copy
+
 from skygear.models import Record, RecordID, Reference
 
 from .database import Database
 from .predicate import Predicate
 from .query import Query
-from .utils import _get_container
+from .utils import _get_container, _request_cache
 
 
 class ChatRecord(Record):
@@ -13,10 +15,12 @@ class ChatRecord(Record):
     def save(self):
         database = self._get_database()
         database.save([self])
+        self.forget([self])
 
     def delete(self):
         database = self._get_database()
         database.delete([self])
+        self.forget([self])
 
     def to_record(self, record):
         record._id = self._id
@@ -32,15 +36,52 @@ class ChatRecord(Record):
     def delete_all(self, records):
         database = self._get_database()
         database.delete(records)
+        self.forget(records)
 
     @classmethod
     def save_all(self, records, atomic=True):
         database = self._get_database()
         database.save(records, atomic)
+        self.forget(records)
+
+    @classmethod
+    def _identity_map(cls):
+        """
+        Return the records of this type fetched in the current request,
+        keyed by id, or None outside of a request context.
+        """
+        cache = _request_cache()
+        if cache is None:
+            return None
+        return cache.setdefault(('records', cls), {})
+
+    @classmethod
+    def forget(cls, records):
+        """
+        Drop records from the identity map of the current request, so
+        that they are fetched again. Records and ids are both accepted.
+        Call this after changing records without saving them through
+        ChatRecord, such as with raw SQL.
+        """
+        identity_map = cls._identity_map()
+        if identity_map is None:
+            return
+        for record in records:
+            if isinstance(record, Record):
+                record = record.id
+            identity_map.pop(cls.__key_from_obj(record), None)
 
     @classmethod
     def _get_database(cls):
-        return Database(_get_container(), cls.database_id)
+        container = _get_container()
+        cache = _request_cache()
+        key = ('database', container, cls.database_id)
+        if cache is not None and key in cache:
+            return cache[key]
+        database = Database(container, cls.database_id)
+        if cache is not None:
+            cache[key] = database
+        return database
 
     @classmethod
     def fetch_one(cls, key):
@@ -51,13 +92,42 @@ class ChatRecord(Record):
 
     @classmethod
     def fetch_all(cls, keys):
+        """
+        Fetch records by id. Records already fetched in the current request
+        are served from its identity map until they are saved, deleted or
+        forgotten. Each call returns copies of the mapped records, so that
+        changing a fetched record does not change what later fetches see.
+        """
         keys = [cls.__key_from_obj(key) for key in keys]
+        identity_map = cls._identity_map()
+        if identity_map is None:
+            return cls.__query_all(keys)
+
+        missing = [key for key in set(keys) if key not in identity_map]
+        if len(missing) > 0:
+            for record in cls.__query_all(missing):
+                identity_map[record.id.key] = record
+        result = []
+        seen = set()
+        for key in keys:
+            if key in identity_map and key not in seen:
+                seen.add(key)
+                result.append(cls.__copy(identity_map[key]))
+        return result
+
+    @classmethod
+    def __copy(cls, record):
+        record = cls.from_record(record)
+        record._data = copy.deepcopy(record.data)
+        return record
+
+    @classmethod
+    def __query_all(cls, keys):
         database = cls._get_database()
         result = database.query(Query(cls.record_type,
                                       predicate=Predicate(_id__in=keys),
                                       limit=len(keys)))
-        result = [cls.from_record(record) for record in result]
-        return result
+        return [cls.from_record(record) for record in result]
 
     @classmethod
     def exists(cls, record):
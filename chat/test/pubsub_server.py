@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class FakePubsubServer:
+    """
+    A minimal websocket server standing in for the Skygear pubsub endpoint.
+
+    It accepts any number of connections, records every text frame it
+    receives together with the index of the connection it arrived on, and
+    can drop all open connections to simulate a server restart.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.connections = []
+        self.messages = []
+        self.headers = []
+        self.received = threading.Condition()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    @property
+    def url(self):
+        return 'ws://127.0.0.1:%d/pubsub' % self.sock.getsockname()[1]
+
+    @property
+    def connection_count(self):
+        return len(self.connections)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.drop_connections()
+        self.sock.close()
+
+    def drop_connections(self):
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def wait_for_messages(self, count, timeout=5):
+        with self.received:
+            self.received.wait_for(lambda: len(self.messages) >= count,
+                                   timeout)
+        return self.messages
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            index = len(self.connections)
+            self.connections.append(conn)
+            threading.Thread(target=self._handle,
+                             args=(conn, index),
+                             daemon=True).start()
+
+    def _handle(self, conn, index):
+        try:
+            self._handshake(conn)
+            while True:
+                opcode, payload = self._read_frame(conn)
+                if opcode == 0x8:
+                    return
+                if opcode == 0x9:
+                    conn.sendall(b'\x8a' + bytes([len(payload)]) + payload)
+                    continue
+                with self.received:
+                    self.messages.append((index,
+                                          json.loads(payload.decode())))
+                    self.received.notify_all()
+        except (OSError, ConnectionError):
+            return
+
+    def _handshake(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = conn.recv(1024)
+            if not chunk:
+                raise ConnectionError('handshake aborted')
+            request += chunk
+        headers = {}
+        for line in request.decode().split('\r\n')[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        self.headers.append(headers)
+        digest = hashlib.sha1(
+            (headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()
+        ).digest()
+        conn.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: %s\r\n\r\n'
+        ).encode() % base64.b64encode(digest))
+
+    def _read_exactly(self, conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection closed')
+            data += chunk
+        return data
+
+    def _read_frame(self, conn):
+        first, second = self._read_exactly(conn, 2)
+        opcode = first & 0x0f
+        length = second & 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', self._read_exactly(conn, 2))
+        elif length == 127:
+            length, = struct.unpack('!Q', self._read_exactly(conn, 8))
+        mask = self._read_exactly(conn, 4) if second & 0x80 else b'\0' * 4
+        payload = self._read_exactly(conn, length)
+        return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
@@ -0,0 +1,67 @@
+import unittest
+
+from ..cache import CacheBackend, LRUCache, create_cache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.cache = LRUCache(maxsize=2, ttl=10, timer=self.timer)
+
+    def test_get_counts_hits_and_misses(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'c': 3})
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.timer.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_delete_many(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.delete_many(['a', 'c'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'b': 2})
+
+
+class TestCacheBackend(unittest.TestCase):
+
+    def test_backend_must_implement_interface(self):
+        class PartialCache(CacheBackend):
+            def get_many(self, keys):
+                return {}
+
+        self.assertRaises(TypeError, CacheBackend)
+        self.assertRaises(TypeError, PartialCache)
+
+
+class TestCreateCache(unittest.TestCase):
+
+    def test_default_backend(self):
+        cache = create_cache('', maxsize=5, ttl=30)
+        self.assertIsInstance(cache, LRUCache)
+        self.assertEqual((cache.maxsize, cache.ttl), (5, 30))
+
+    def test_backend_by_path(self):
+        cache = create_cache('chat.cache.LRUCache', maxsize=5, ttl=30)
+        self.assertIsInstance(cache, LRUCache)
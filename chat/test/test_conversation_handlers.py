@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from ..conversation_handlers import (handle_add_participants,
+                                     handle_create_conversation_lambda,
+                                     handle_remove_participants)
+
+
+class TestParticipantSummaryRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.user_conversation = Mock()
+        self.user_conversation.fetch_existing_user_ids.return_value = []
+        self.user_conversation.save_all.side_effect = \
+            lambda *args, **kwargs: self.events.append('save')
+        self.user_conversation.delete_all.side_effect = \
+            lambda *args, **kwargs: self.events.append('delete')
+        self.refresh = Mock(side_effect=lambda ids: self.events.append(
+            ('refresh', ids)))
+        conversation = MagicMock()
+        conversation.__getitem__.return_value = []
+        self.patchers = [
+            patch('chat.conversation_handlers.current_user_id',
+                  Mock(return_value='user1')),
+            patch('chat.conversation_handlers._get_container', Mock()),
+            patch('chat.conversation_handlers.RolesHelper', Mock()),
+            patch('chat.conversation_handlers.Conversation',
+                  Mock(new=Mock(return_value=conversation),
+                       fetch_one=Mock(return_value=conversation))),
+            patch('chat.conversation_handlers.UserConversation',
+                  self.user_conversation),
+            patch('chat.conversation_handlers.serialize_record',
+                  Mock(return_value={'participant_ids': []})),
+            patch('chat.conversation_handlers._publish_record_event', Mock()),
+            patch('chat.conversation_handlers.invalidate_memberships',
+                  Mock()),
+            patch('chat.conversation_handlers.refresh_participant_summary',
+                  self.refresh),
+        ]
+        for name in ['send_after_conversation_created_hook',
+                     'send_after_users_added_to_conversation_hook',
+                     'send_after_users_removed_from_conversation_hook']:
+            self.patchers.append(
+                patch('chat.conversation_handlers.' + name, Mock()))
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def test_add_participants_refreshes_once_after_save(self):
+        self.user_conversation.fetch_existing_user_ids.return_value = \
+            ['user2']
+        handle_add_participants('c1', ['user2', 'user3', 'user4', 'user3'])
+        self.assertEqual(self.events, ['save', ('refresh', ['c1'])])
+
+    def test_add_existing_participants_does_not_refresh(self):
+        self.user_conversation.fetch_existing_user_ids.return_value = \
+            ['user2']
+        handle_add_participants('c1', ['user2'])
+        self.assertFalse(self.refresh.called)
+
+    def test_remove_participants_refreshes_once_after_delete(self):
+        handle_remove_participants('c1', ['user2', 'user3'])
+        self.assertEqual(self.events, ['delete', ('refresh', ['c1'])])
+
+    def test_create_conversation_refreshes_once(self):
+        result = handle_create_conversation_lambda(
+            ['user2', 'user3'], 'title', {}, {'adminIDs': ['user2']})
+        self.assertEqual(self.refresh.call_count, 1)
+        self.assertEqual(self.events[0], 'save')
+        self.assertEqual(self.user_conversation.mark_all_admin.call_count, 1)
+        self.assertIn('conversation', result)
@@ -0,0 +1,114 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+from skygear.models import RecordID, Reference
+
+from ..database import Database
+from ..direct_query import UnsupportedQuery, _serialize_row, compile_query
+from ..predicate import Predicate
+from ..query import Query
+
+
+@patch('chat.direct_query._get_schema_name', Mock(return_value='app_dev'))
+class TestCompileQuery(unittest.TestCase):
+
+    def test_predicate_sort_and_limit(self):
+        predicate = Predicate(conversation__eq='c1', deleted__eq=False) & (
+            Predicate(seq__lt=10) | ~Predicate(_id__in=['m1', 'm2']))
+        query = Query('message', predicate=predicate, limit=20, offset=40)
+        query.add_order('_created_at', 'desc').add_order('_id', 'asc')
+        sql, params = compile_query(query)
+
+        self.assertIn('WHERE _database_id = \'\' AND ('
+                      '"conversation" = %(p0)s AND "deleted" = %(p1)s AND '
+                      '("seq" < %(p2)s OR NOT ("_id" = ANY(%(p3)s))))', sql)
+        self.assertIn('ORDER BY "_created_at" DESC, "_id" ASC '
+                      'LIMIT %(limit)s OFFSET %(offset)s', sql)
+        self.assertEqual(params['p0'], 'c1')
+        self.assertEqual(params['p1'], False)
+        self.assertEqual(params['p2'], 10)
+        self.assertEqual(params['p3'], ['m1', 'm2'])
+        self.assertEqual(params['limit'], 20)
+        self.assertEqual(params['offset'], 40)
+
+    def test_values_are_converted(self):
+        aware = datetime(2017, 1, 1, 8, 0, tzinfo=timezone.utc)
+        predicate = Predicate(user__eq=Reference(RecordID('user', 'u1')),
+                              _created_at__gte=aware,
+                              last_read_message__eq=None)
+        sql, params = compile_query(Query('user_conversation',
+                                          predicate=predicate))
+        self.assertIn('"last_read_message" IS NULL', sql)
+        self.assertEqual(params['p0'], datetime(2017, 1, 1, 8, 0))
+        self.assertEqual(params['p1'], 'u1')
+
+    def test_unsupported_queries(self):
+        with self.assertRaises(UnsupportedQuery):
+            compile_query(Query('message_history'))
+        with self.assertRaises(UnsupportedQuery):
+            compile_query(Query('message', include=['parent']))
+        with self.assertRaises(UnsupportedQuery):
+            compile_query(Query('message',
+                                predicate=Predicate(body__like='%hi%')))
+
+
+class TestSerializeRow(unittest.TestCase):
+
+    def test_row_is_serialized_like_record_query(self):
+        row = {
+            '_id': 'm1',
+            '_database_id': '',
+            '_owner_id': 'u1',
+            '_access': [{'level': 'write', 'role': 'admin'}],
+            '_created_at': datetime(2017, 1, 1, 0, 0, 0, 1),
+            '_created_by': 'u1',
+            '_updated_at': datetime(2017, 1, 1, 0, 0, 0, 2),
+            '_updated_by': 'u1',
+            'conversation': 'c1',
+            'attachment': 'file.png',
+            'edited_at': datetime(2017, 1, 1),
+            'revision': 2.0,
+            'body': None,
+        }
+        self.assertEqual(_serialize_row('message', row), {
+            '_id': 'message/m1',
+            '_ownerID': 'u1',
+            '_access': [{'level': 'write', 'role': 'admin'}],
+            '_created_at': '2017-01-01T00:00:00.000001Z',
+            '_created_by': 'u1',
+            '_updated_at': '2017-01-01T00:00:00.000002Z',
+            '_updated_by': 'u1',
+            'conversation': {'$type': 'ref', '$id': 'conversation/c1'},
+            'attachment': {'$type': 'asset', '$name': 'file.png'},
+            'edited_at': {'$type': 'date',
+                          '$date': '2017-01-01T00:00:00.000000Z'},
+            'revision': 2,
+        })
+
+
+class TestDatabaseQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.container = Mock()
+        self.container.send_action.return_value = {'result': []}
+        self.database = Database(self.container, '_public')
+
+    @patch('chat.database.direct_query.fetch')
+    def test_direct_query(self, mock_fetch):
+        mock_fetch.return_value = [{'_id': 'message/m1', 'body': 'hi'}]
+        result = self.database.query(Query('message', direct=True))
+        self.assertEqual(result[0]['body'], 'hi')
+        self.assertFalse(self.container.send_action.called)
+
+    @patch('chat.database.direct_query.fetch',
+           Mock(side_effect=UnsupportedQuery()))
+    def test_unsupported_query_falls_back_to_container(self):
+        self.database.query(Query('message', direct=True))
+        self.assertTrue(self.container.send_action.called)
+
+    @patch('chat.database.direct_query.fetch')
+    def test_container_query_by_default(self, mock_fetch):
+        self.database.query(Query('message'))
+        self.assertFalse(mock_fetch.called)
+        self.assertTrue(self.container.send_action.called)
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from unittest.mock import Mock
+
+from skygear.utils.context import current_user_id, start_context
+
+from ..dispatcher import Dispatcher
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def test_submit_runs_job_in_background(self):
+        dispatcher = Dispatcher(workers=1)
+        job = Mock()
+        self.assertTrue(dispatcher.submit(job, 'a', key='b'))
+        dispatcher.join()
+        job.assert_called_once_with('a', key='b')
+        self.assertEqual(dispatcher.stats()['delivered'], 1)
+
+    def test_job_runs_in_submitter_context(self):
+        dispatcher = Dispatcher(workers=1)
+        seen = []
+        with start_context({'user_id': 'user1'}):
+            dispatcher.submit(lambda: seen.append(current_user_id()))
+        dispatcher.join()
+        self.assertEqual(seen, ['user1'])
+
+    def test_full_queue_drops_jobs(self):
+        dispatcher = Dispatcher(workers=1, maxsize=1, put_timeout=0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocking_job():
+            started.set()
+            release.wait(5)
+
+        dispatcher.submit(blocking_job)
+        started.wait(5)
+        self.assertTrue(dispatcher.submit(Mock()))
+        self.assertFalse(dispatcher.submit(Mock()))
+        stats = dispatcher.stats()
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['queued'], 1)
+
+        release.set()
+        dispatcher.join()
+        self.assertEqual(dispatcher.stats()['delivered'], 2)
+
+    def test_failed_job_is_counted(self):
+        dispatcher = Dispatcher(workers=1)
+        dispatcher.submit(Mock(side_effect=ValueError()))
+        dispatcher.join()
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    def test_no_workers_runs_inline(self):
+        dispatcher = Dispatcher(workers=0)
+        job = Mock()
+        dispatcher.submit(job)
+        job.assert_called_once_with()
+
+    def test_jobs_with_same_key_run_in_order(self):
+        dispatcher = Dispatcher(workers=4)
+        seen = []
+        for i in range(20):
+            dispatcher.submit_ordered('c1', seen.append, i)
+        dispatcher.join()
+        self.assertEqual(seen, list(range(20)))
+        self.assertIs(dispatcher._queue_for('c1'),
+                      dispatcher._queue_for('c1'))
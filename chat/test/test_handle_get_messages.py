@@ -1,6 +1,6 @@
 import unittest
 from datetime import datetime, timedelta, timezone
-from unittest.mock import Mock, call, patch
+from unittest.mock import ANY, MagicMock, Mock, call, patch
 
 from skygear.models import Record, RecordID
 from skygear.encoding import deserialize_record
@@ -8,7 +8,9 @@ from skygear.encoding import deserialize_record
 from ..conversation import Conversation
 from ..user_conversation import UserConversation
 from ..message import Message
-from ..exc import InvalidGetMessagesConditionArgumentException
+from ..exc import (ConversationNotFoundException,
+                   InvalidGetMessagesConditionArgumentException,
+                   MessageNotFoundException)
 from ..message_handlers import handle_message_after_save
 
 
@@ -16,158 +18,163 @@ from ..message_handlers import get_messages
 
 class TestHandleGetMessages(unittest.TestCase):
 
-    def mock_fetch_messages_func(self, conversation_id, limit,
-                                 before_time=None, before_message_id=None,
-                                 after_time=None, after_message_id=None,
-                                 order=None, deleted=False):
+    def setUp(self):
+        self.resolve_range = Mock(return_value=(True, None, None))
+        self.patchers = [
+            patch('chat.message_handlers.db.conn', MagicMock()),
+            patch('chat.message_handlers.current_user_id',
+                  Mock(return_value='u1')),
+            patch('chat.message_handlers.Message.resolve_range',
+                  self.resolve_range),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def mock_fetch_page_func(self, conversation_id, limit,
+                             before_time=None, before_seq=None,
+                             after_time=None, after_seq=None,
+                             order=None, deleted_limit=100):
         base_created_at = datetime(2017, 11, 8, 0, 0, tzinfo=timezone.utc)
         owner_id = 'u1'
         acl = None
 
-        if deleted:
-            return [Record(RecordID('message', 'rd1'), owner_id, acl,
-                    created_at=base_created_at - timedelta(hours=1))]
-        else:
-            if conversation_id == 'empty_conversation':
-                return []
-            else:
-                return [Record(RecordID('message', 'r3'), owner_id, acl,
-                               created_at=base_created_at - timedelta(days=1)),
-                        Record(RecordID('message', 'r2'), owner_id, acl,
-                               created_at=base_created_at - timedelta(days=2)),
-                        Record(RecordID('message', 'r1'), owner_id, acl,
-                               created_at=base_created_at - timedelta(days=3))]
-
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_emptied_messages(self, mock_fetch_messages):
+        deleted = [Record(RecordID('message', 'rd1'), owner_id, acl,
+                          created_at=base_created_at - timedelta(hours=1))]
+        if conversation_id == 'empty_conversation':
+            return [], deleted
+        return [Record(RecordID('message', 'r3'), owner_id, acl,
+                       created_at=base_created_at - timedelta(days=1)),
+                Record(RecordID('message', 'r2'), owner_id, acl,
+                       created_at=base_created_at - timedelta(days=2)),
+                Record(RecordID('message', 'r1'), owner_id, acl,
+                       created_at=base_created_at - timedelta(days=3))], \
+            deleted
+
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_emptied_messages(self, mock_fetch_page):
         conversation_id = 'empty_conversation'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
         result = get_messages(conversation_id, 3)
 
-        mock_fetch_messages.assert_has_calls([
-            call('empty_conversation', 3,
-                 after_time=None, before_time=None, order=None),
-            call('empty_conversation', 999999,
-                 after_time=None, before_time=None,
-                 deleted=True, order=None)
-        ])
+        mock_fetch_page.assert_called_once_with(
+            'empty_conversation', 3,
+            before_time=None, before_seq=None,
+            after_time=None, after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 0)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_messages_without_params(self, mock_fetch_messages):
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_messages_without_params(self, mock_fetch_page):
         conversation_id = 'c1'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
         result = get_messages(conversation_id, 3)
 
-        mock_fetch_messages.assert_has_calls([
-            call('c1', 3,
-                 after_time=None, before_time=None, order=None),
-            call('c1', 999999,
-                 after_time='2017-11-05T00:00:00Z',
-                 before_time=None,
-                 deleted=True, order=None)
-        ])
+        mock_fetch_page.assert_called_once_with(
+            'c1', 3,
+            before_time=None, before_seq=None,
+            after_time=None, after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 3)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_messages_with_before_time(self, mock_fetch_messages):
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_messages_with_before_time(self, mock_fetch_page):
         conversation_id = 'c1'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
-        result = get_messages(conversation_id, 3, before_time='2017-11-12T00:00:00Z')
+        result = get_messages(conversation_id, 3,
+                              before_time='2017-11-12T00:00:00Z')
 
-        mock_fetch_messages.assert_has_calls([
-            call('c1', 3,
-                 after_time=None, before_time='2017-11-12T00:00:00Z', order=None),
-            call('c1', 999999,
-                 after_time='2017-11-05T00:00:00Z',
-                 before_time='2017-11-12T00:00:00Z',
-                 deleted=True, order=None)
-        ])
+        mock_fetch_page.assert_called_once_with(
+            'c1', 3,
+            before_time='2017-11-12T00:00:00Z', before_seq=None,
+            after_time=None, after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 3)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_messages_with_after_time(self, mock_fetch_messages):
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_messages_with_after_time(self, mock_fetch_page):
         conversation_id = 'c1'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
-        result = get_messages(conversation_id, 3, after_time='2017-11-03T00:00:00Z')
+        result = get_messages(conversation_id, 3,
+                              after_time='2017-11-03T00:00:00Z')
 
-        mock_fetch_messages.assert_has_calls([
-            call('c1', 3,
-                 after_time='2017-11-03T00:00:00Z', before_time=None, order=None),
-            call('c1', 999999,
-                 after_time='2017-11-03T00:00:00Z',
-                 before_time='2017-11-07T00:00:00Z',
-                 deleted=True, order=None)
-        ])
+        mock_fetch_page.assert_called_once_with(
+            'c1', 3,
+            before_time=None, before_seq=None,
+            after_time='2017-11-03T00:00:00Z', after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 3)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_messages_with_time_range(self, mock_fetch_messages):
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_messages_with_time_range(self, mock_fetch_page):
         conversation_id = 'c1'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
         result = get_messages(conversation_id, 3,
                               after_time='2017-11-03T00:00:00Z',
                               before_time='2017-11-12T00:00:00Z')
 
-        mock_fetch_messages.assert_has_calls([
-            call('c1', 3,
-                 after_time='2017-11-03T00:00:00Z',
-                 before_time='2017-11-12T00:00:00Z',
-                 order=None),
-            call('c1', 999999,
-                 after_time='2017-11-03T00:00:00Z',
-                 before_time='2017-11-12T00:00:00Z',
-                 deleted=True, order=None)
-        ])
+        mock_fetch_page.assert_called_once_with(
+            'c1', 3,
+            before_time='2017-11-12T00:00:00Z', before_seq=None,
+            after_time='2017-11-03T00:00:00Z', after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 3)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Message.fetch_all_by_conversation_id')
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
-    def test_get_messages_with_message_id(self, mock_fetch_messages):
+    @patch('chat.message_handlers.Message.fetch_page_by_conversation_id')
+    def test_get_messages_with_message_id(self, mock_fetch_page):
         conversation_id = 'c1'
 
-        mock_fetch_messages.side_effect = self.mock_fetch_messages_func
+        self.resolve_range.return_value = (True, 4, None)
+        mock_fetch_page.side_effect = self.mock_fetch_page_func
 
         result = get_messages(conversation_id, 3, before_message_id='r4')
 
-        mock_fetch_messages.assert_has_calls([
-            call('c1', 3,
-                 after_message_id=None, before_message_id='r4', order=None),
-            call('c1', 999999,
-                 after_message_id='r1',
-                 before_message_id='r4',
-                 deleted=True, order=None)
-        ])
+        self.resolve_range.assert_called_once_with(
+            ANY, 'c1', 'u1', 'r4', None)
+        mock_fetch_page.assert_called_once_with(
+            'c1', 3,
+            before_time=None, before_seq=4,
+            after_time=None, after_seq=None,
+            order=None, deleted_limit=100)
 
         self.assertIs(len(result['results']), 3)
         self.assertIs(len(result['deleted']), 1)
 
-    @patch('chat.message_handlers.Conversation.exists', Mock(return_value=True))
+    def test_get_messages_not_in_conversation(self):
+        self.resolve_range.return_value = (False, None, None)
+
+        with self.assertRaises(ConversationNotFoundException):
+            get_messages('c1', 3)
+
+    def test_get_messages_with_unknown_message_id(self):
+        self.resolve_range.return_value = (True, None, None)
+
+        with self.assertRaises(MessageNotFoundException):
+            get_messages('c1', 3, after_message_id='r4')
+
     def test_get_messages_with_both_time_and_message_id(self):
         conversation_id = 'c1'
 
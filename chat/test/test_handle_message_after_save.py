@@ -4,7 +4,6 @@ from unittest.mock import Mock, patch
 from skygear.encoding import deserialize_record
 
 from ..conversation import Conversation
-from ..user_conversation import UserConversation
 from ..message import Message
 from ..exc import SkygearChatException
 from ..message_handlers import handle_message_after_save
@@ -55,9 +54,8 @@ class TestHandleMessageAfterSave(unittest.TestCase):
             'body': 'hihi'
         })
 
-    @patch('chat.message.UserConversation.fetch_all_by_conversation_id',
-           Mock(return_value=[UserConversation.new(Conversation.new('a', 'user1'), 'user1'),
-                              UserConversation.new(Conversation.new('a', 'user2'), 'user2')]))
+    @patch('chat.message.UserConversation.fetch_participant_ids',
+           Mock(return_value={'1': ['user1', 'user2']}))
     @patch('chat.message._publish_record_event')
     @patch('chat.message_handlers._get_schema_name', Mock(return_value='app_dev'))
     @patch('chat.message.UserConversation.fetch_one', Mock(return_value=None))
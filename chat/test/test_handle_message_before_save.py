@@ -53,3 +53,24 @@ class TestHandleMessageBeforeSave(unittest.TestCase):
         with self.assertRaises(SkygearChatException) as cm:
             handle_message_before_save(
                 self.record(), None, self.conn)
+
+    @patch('chat.message_handlers.current_user_id',
+           Mock(return_value='user1'))
+    @patch('chat.message_handlers.Conversation.get_message_acl', Mock())
+    @patch('chat.message.UserConversation.fetch_one', Mock())
+    def test_new_message_starts_unread(self):
+        record = handle_message_before_save(self.record(), None, self.conn)
+        self.assertEqual(record['read_count'], 0)
+        self.assertEqual(record['message_status'], 'delivered')
+
+    @patch('chat.message_handlers.current_user_id',
+           Mock(return_value='user1'))
+    @patch('chat.message_handlers.Conversation.get_message_acl', Mock())
+    @patch('chat.message.UserConversation.fetch_one', Mock())
+    @patch.object(MessageHistory, 'save', Mock())
+    def test_client_cannot_overwrite_read_count(self):
+        record = self.record()
+        record['read_count'] = 100
+        record = handle_message_before_save(
+            record, self.original_record(), self.conn)
+        self.assertNotIn('read_count', record)
@@ -0,0 +1,114 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from skygear.utils.context import current_user_id, start_context
+
+from ..dispatcher import Dispatcher
+from ..hook_delivery import HookDelivery
+
+
+class TestHookDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self.container = Mock()
+        self.container.send_action.return_value = {'result': None}
+        self.delays = []
+        self.patcher = patch('chat.hook_delivery._get_container',
+                             Mock(return_value=self.container))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def call_later(self, delay, fn, *args):
+        # retry at once, but keep the delay for assertions
+        self.delays.append(delay)
+        fn(*args)
+
+    def delivery(self, workers=0, **kwargs):
+        return HookDelivery(Dispatcher(workers=workers),
+                            call_later=self.call_later, **kwargs)
+
+    def connect_error(self):
+        reason = NewConnectionError(None, 'Connection refused')
+        return ConnectionError(MaxRetryError(None, '/', reason))
+
+    def test_events_are_coalesced_per_hook(self):
+        delivery = self.delivery(workers=1, batch_size=2)
+        blocker = threading.Event()
+        delivery.dispatcher.submit(blocker.wait)
+        for user_id in ['user1', 'user2', 'user3']:
+            with start_context({'user_id': user_id}):
+                delivery.send('chat:hook', lambda: {'user': current_user_id()})
+        self.assertEqual(delivery.stats()['queued'], 3)
+        blocker.set()
+        delivery.join()
+
+        self.assertEqual(
+            [c[0][1]['args']['user']
+             for c in self.container.send_action.call_args_list],
+            ['user1', 'user2', 'user3'])
+        stats = delivery.stats()
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(stats['delivered'], 3)
+        self.assertEqual(stats['queued'], 0)
+
+    def test_connect_error_is_retried_with_backoff(self):
+        self.container.send_action.side_effect = [
+            self.connect_error(), ConnectTimeout(), {'result': None}]
+        delivery = self.delivery(retries=3, retry_delay=0.5)
+        delivery.send('chat:hook', lambda: {})
+        self.assertEqual(self.container.send_action.call_count, 3)
+        self.assertEqual(self.delays, [0.5, 1.0])
+        stats = delivery.stats()
+        self.assertEqual((stats['retried'], stats['delivered']), (2, 1))
+
+    def test_delivery_gives_up_after_retries(self):
+        self.container.send_action.side_effect = ConnectTimeout()
+        delivery = self.delivery(retries=2)
+        delivery.send('chat:hook', lambda: {})
+        self.assertEqual(self.container.send_action.call_count, 3)
+        self.assertEqual(delivery.stats()['failed'], 1)
+
+    def test_error_after_connecting_is_not_retried(self):
+        # the hook may have been received, so it is not sent again
+        for error in [ReadTimeout(), ConnectionError('Connection aborted'),
+                      ValueError()]:
+            self.container.send_action.side_effect = error
+            delivery = self.delivery()
+            delivery.send('chat:hook', lambda: {})
+            self.assertEqual(delivery.stats()['failed'], 1)
+        self.assertEqual(self.container.send_action.call_count, 3)
+        self.assertEqual(self.delays, [])
+
+    def test_retry_does_not_hold_worker(self):
+        scheduled = []
+        self.container.send_action.side_effect = [
+            ConnectTimeout(), {'result': None}, {'result': None}]
+        delivery = HookDelivery(
+            Dispatcher(workers=1),
+            call_later=lambda delay, fn, *args: scheduled.append(
+                (fn, args)))
+        delivery.send('chat:hook1', lambda: {})
+        delivery.send('chat:hook2', lambda: {})
+        delivery.dispatcher.join()
+        self.assertEqual(len(scheduled), 1)
+        stats = delivery.stats()
+        self.assertEqual((stats['delivered'], stats['queued']), (1, 1))
+
+        fn, args = scheduled.pop()
+        threading.Thread(target=fn, args=args).start()
+        delivery.join()
+        stats = delivery.stats()
+        self.assertEqual((stats['delivered'], stats['queued']), (2, 0))
+
+    def test_handler_error_is_not_retried(self):
+        self.container.send_action.return_value = {'error': {'code': 1}}
+        delivery = self.delivery()
+        delivery.send('chat:hook', lambda: {})
+        self.assertEqual(self.container.send_action.call_count, 1)
+        self.assertEqual(delivery.stats()['failed'], 1)
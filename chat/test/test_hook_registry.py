@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+from ..hook_registry import ALL_FIELDS, HookRegistry
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def message_sent(message, participants):
+    pass
+
+
+def typing_started(**kwargs):
+    pass
+
+
+@patch('chat.hook_registry.get_registry')
+class TestHookRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.func_map = {'chat:after_message_sent_hook': message_sent}
+
+    def registry(self, mock_get_registry, **kwargs):
+        mock_get_registry.return_value.func_map = {'op': self.func_map}
+        return HookRegistry(ttl=10, timer=self.timer, **kwargs)
+
+    def test_fields_from_handler_arguments(self, mock_get_registry):
+        registry = self.registry(mock_get_registry)
+        self.assertTrue(registry.is_subscribed('chat:after_message_sent_hook'))
+        self.assertTrue(registry.wants('chat:after_message_sent_hook',
+                                       'participants'))
+        self.assertFalse(registry.wants('chat:after_message_sent_hook',
+                                        'conversation'))
+        self.assertFalse(registry.is_subscribed('chat:typing_started_hook'))
+
+    def test_external_hooks_get_all_fields(self, mock_get_registry):
+        registry = self.registry(mock_get_registry,
+                                 external=['chat:typing_started_hook'])
+        self.assertTrue(registry.wants('chat:typing_started_hook', 'events'))
+        self.assertFalse(
+            registry.is_subscribed('chat:after_message_deleted_hook'))
+
+    def test_every_hook_is_external(self, mock_get_registry):
+        registry = self.registry(mock_get_registry, external=['*'])
+        self.assertTrue(
+            registry.is_subscribed('chat:after_message_deleted_hook'))
+        self.assertTrue(registry.wants('chat:after_message_sent_hook',
+                                       'conversation'))
+
+    def test_subscribers_are_refreshed(self, mock_get_registry):
+        registry = self.registry(mock_get_registry)
+        self.assertFalse(registry.is_subscribed('chat:typing_started_hook'))
+        self.func_map['chat:typing_started_hook'] = typing_started
+        self.timer.now = 5
+        self.assertFalse(registry.is_subscribed('chat:typing_started_hook'))
+        self.timer.now = 10
+        self.assertTrue(registry.wants('chat:typing_started_hook', 'events'))
+        self.assertIs(registry._subscribers['chat:typing_started_hook'],
+                      ALL_FIELDS)
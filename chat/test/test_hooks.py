@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from skygear.encoding import deserialize_record
+
+from ..cache import LRUCache
+from ..dispatcher import Dispatcher
+from ..hook_delivery import HookDelivery
+from ..hook_registry import HookRegistry
+from ..hooks import (get_users, invalidate_users,
+                     send_after_message_sent_hook,
+                     send_after_users_added_to_conversation_hook)
+
+
+def user(user_id):
+    return deserialize_record({
+        '_id': 'user/' + user_id,
+        '_access': None,
+        '_ownerID': user_id,
+        'name': user_id
+    })
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.container = Mock()
+        self.container.send_action.side_effect = self.send_action
+        self.users = {'user1': user('user1'), 'user2': user('user2')}
+        self.patchers = [
+            patch('chat.hooks._user_cache', LRUCache()),
+            patch('chat.hook_registry._hook_registry',
+                  HookRegistry(external=['*'])),
+            patch('chat.hook_delivery._hook_delivery',
+                  HookDelivery(Dispatcher(workers=0))),
+            patch('chat.hooks._get_container',
+                  Mock(return_value=self.container)),
+            patch('chat.hook_delivery._get_container',
+                  Mock(return_value=self.container)),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def send_action(self, action, payload):
+        if action != 'record:query':
+            return {}
+        user_ids = payload['predicate'][2]
+        return {'result': [{'_id': 'user/' + user_id, '_access': None,
+                            '_ownerID': user_id, 'name': user_id}
+                           for user_id in user_ids
+                           if user_id in self.users]}
+
+    def queried_user_ids(self):
+        return [c[0][1]['predicate'][2]
+                for c in self.container.send_action.call_args_list
+                if c[0][0] == 'record:query']
+
+    def test_users_are_cached(self):
+        self.assertEqual([u['_id'] for u in get_users(['user2', 'user1'])],
+                         ['user/user2', 'user/user1'])
+        self.assertEqual([u['_id'] for u in get_users(['user1', 'user3'])],
+                         ['user/user1'])
+        self.assertEqual(self.queried_user_ids(),
+                         [['user2', 'user1'], ['user3']])
+
+    def test_invalidate_refetches_user(self):
+        get_users(['user1'])
+        invalidate_users(['user1'])
+        get_users(['user1'])
+        self.assertEqual(self.queried_user_ids(), [['user1'], ['user1']])
+
+    def test_hook_with_users(self):
+        send_after_users_added_to_conversation_hook({}, ['user1'], ['user2'])
+        name, payload = self.container.send_action.call_args[0]
+        self.assertEqual(name, 'chat:after_users_added_to_conversation_hook')
+        self.assertEqual(payload['args']['participants'][0]['_id'],
+                         'user/user1')
+        self.assertEqual(payload['args']['new_users'][0]['_id'],
+                         'user/user2')
+
+    @patch('chat.hooks.settings')
+    def test_hook_with_user_ids_only(self, mock_settings):
+        mock_settings.chat.hook_user_ids_only = True
+        send_after_users_added_to_conversation_hook({}, ['user1'], ['user2'])
+        self.assertEqual(self.queried_user_ids(), [])
+        payload = self.container.send_action.call_args[0][1]
+        self.assertEqual(payload['args'], {'conversation': {},
+                                           'participant_ids': ['user1'],
+                                           'new_user_ids': ['user2']})
+
+    @patch('chat.hook_registry._hook_registry', HookRegistry())
+    def test_hook_without_subscriber_is_skipped(self):
+        send_after_message_sent_hook({}, {}, ['user1'])
+        self.assertFalse(self.container.send_action.called)
+
+    @patch('chat.hook_registry._hook_registry', HookRegistry())
+    @patch('chat.hook_registry.get_registry')
+    def test_subscriber_gets_declared_fields(self, mock_get_registry):
+        def handler(message, conversation):
+            pass
+        mock_get_registry.return_value.func_map = {
+            'op': {'chat:after_message_sent_hook': handler}}
+
+        send_after_message_sent_hook({'body': 'hi'}, {}, ['user1'])
+        self.assertEqual(self.queried_user_ids(), [])
+        payload = self.container.send_action.call_args[0][1]
+        self.assertEqual(payload['args'], {'message': {'body': 'hi'},
+                                           'conversation': {}})
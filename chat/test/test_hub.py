@@ -0,0 +1,100 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from ..hub import FRAMES_PER_WRITE, Hub, _encode_pub_frames
+from .pubsub_server import FakePubsubServer
+
+
+class TestHub(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakePubsubServer().start()
+        self.hub = Hub(end_point=self.server.url, api_key='changeme')
+
+    def tearDown(self):
+        self.hub.close()
+        self.server.stop()
+
+    def test_publish_sends_frame_per_channel(self):
+        self.hub.publish(['channel1', 'channel2'], {'event': 'create'})
+        messages = self.server.wait_for_messages(2)
+        self.assertEqual([m for _, m in messages], [
+            {'action': 'pub', 'channel': 'channel1',
+             'data': {'event': 'create'}},
+            {'action': 'pub', 'channel': 'channel2',
+             'data': {'event': 'create'}},
+        ])
+        self.assertEqual(self.server.headers[0]['x-skygear-api-key'],
+                         'changeme')
+
+    def test_publish_reuses_connection(self):
+        for i in range(5):
+            self.hub.publish('channel1', {'seq': i})
+        messages = self.server.wait_for_messages(5)
+        self.assertEqual(len(messages), 5)
+        self.assertEqual(self.server.connection_count, 1)
+        self.assertEqual({index for index, _ in messages}, {0})
+
+    def test_publish_reconnects_after_server_drops_connection(self):
+        self.hub.publish('channel1', {'seq': 1})
+        self.server.wait_for_messages(1)
+        self.server.drop_connections()
+
+        self.hub.publish('channel1', {'seq': 2})
+        messages = self.server.wait_for_messages(2)
+        self.assertEqual(self.server.connection_count, 2)
+        self.assertEqual(messages[1], (1, {'action': 'pub',
+                                           'channel': 'channel1',
+                                           'data': {'seq': 2}}))
+
+    def test_idle_connection_expires(self):
+        hub = Hub(end_point=self.server.url, api_key='changeme',
+                  max_idle=-1)
+        hub.publish('channel1', {'seq': 1})
+        hub.publish('channel1', {'seq': 2})
+        self.server.wait_for_messages(2)
+        self.assertEqual(self.server.connection_count, 2)
+        hub.close()
+
+    def test_publish_resends_remaining_frames_on_broken_connection(self):
+        broken = MagicMock(get_mask_key=None)
+        broken.sock.sendall.side_effect = [None, BrokenPipeError()]
+        healthy = MagicMock(get_mask_key=None)
+        channels = ['channel%d' % i for i in range(FRAMES_PER_WRITE * 3)]
+        with patch.object(self.hub.pool, '_connect',
+                          side_effect=[broken, healthy]):
+            self.hub.publish(channels, {})
+        self.assertEqual(broken.sock.sendall.call_count, 2)
+        self.assertTrue(broken.close.called)
+        self.assertEqual(healthy.sock.sendall.call_count, 2)
+        self.assertEqual(len(self.hub.pool), 1)
+
+    def test_publish_many_channels_in_batches(self):
+        channels = ['channel%d' % i for i in range(FRAMES_PER_WRITE * 2 + 1)]
+        self.hub.publish(channels, {'record': {'body': 'hi'}})
+        messages = self.server.wait_for_messages(len(channels))
+        self.assertEqual([m['channel'] for _, m in messages], channels)
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_publish_many_uses_one_connection(self):
+        self.hub.publish_many(['channel1', 'channel2'],
+                              [{'seq': 1}, {'seq': 2}])
+        messages = self.server.wait_for_messages(4)
+        self.assertEqual([(m['channel'], m['data']) for _, m in messages], [
+            ('channel1', {'seq': 1}), ('channel2', {'seq': 1}),
+            ('channel1', {'seq': 2}), ('channel2', {'seq': 2}),
+        ])
+        self.assertEqual(self.server.connection_count, 1)
+
+    def test_payload_encoded_once(self):
+        data = {'record': {'body': 'hi', 'seq': 1}}
+        with patch('chat.hub.encoder', wraps=json.dumps) as encoder:
+            frames = _encode_pub_frames(['a', 'b', 'c'], data)
+        self.assertEqual(
+            [c for c in encoder.call_args_list if c[0][0] is data],
+            [((data,),)])
+        self.assertEqual([json.loads(f) for f in frames], [
+            {'action': 'pub', 'channel': channel, 'data': data}
+            for channel in ['a', 'b', 'c']
+        ])
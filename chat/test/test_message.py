@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from skygear.encoding import deserialize_record
+
+from ..message import Message
+
+
+def message(message_id, conversation_id):
+    return Message.from_record(deserialize_record({
+        '_id': 'message/' + message_id,
+        '_access': None,
+        '_ownerID': 'user1',
+        'conversation': {
+            '$type': 'ref',
+            '$id': 'conversation/' + conversation_id
+        },
+        'body': 'hihi'
+    }))
+
+
+class TestMessage(unittest.TestCase):
+
+    @patch('chat.message._get_schema_name', Mock(return_value='app_dev'))
+    def test_update_all_message_status_from_counters(self):
+        messages = [message('m1', 'c1'), message('m2', 'c1'),
+                    message('m3', 'c2')]
+        conn = Mock()
+        conn.execute.return_value = [('m1', 'now', 'all_read'),
+                                     ('m3', 'now', 'some_read')]
+        Message.update_all_message_status(conn, messages)
+
+        self.assertEqual(conn.execute.call_count, 1)
+        params = conn.execute.call_args[0][1]
+        self.assertEqual(params['message_ids'], ['m1', 'm2', 'm3'])
+        sql = conn.execute.call_args[0][0]
+        self.assertIn('m.read_count < COALESCE(c.participant_count, 0)', sql)
+        self.assertNotIn('receipt', sql)
+        self.assertEqual(messages[0]['message_status'], 'all_read')
+        self.assertNotIn('message_status', messages[1])
+        self.assertEqual(messages[2]['message_status'], 'some_read')
+
+    @patch('chat.message._publish_record_events')
+    @patch('chat.message.UserConversation.fetch_participant_ids',
+           Mock(return_value={'c1': ['user1', 'user2'], 'c2': ['user1']}))
+    def test_notify_all_participants_batches_per_conversation(
+            self, mock_publish):
+        messages = [message('m1', 'c1'), message('m2', 'c1'),
+                    message('m3', 'c2')]
+        Message.notify_all_participants(messages)
+
+        self.assertEqual(mock_publish.call_count, 2)
+        calls = {c[0][0][-1]: c[0] for c in mock_publish.call_args_list}
+        self.assertEqual(calls['user2'][0], ['user1', 'user2'])
+        self.assertEqual(calls['user2'][3], messages[:2])
+        self.assertEqual(calls['user1'][3], messages[2:])
+
+
+def row(message_id, created_at, deleted=False):
+    return deserialize_record({
+        '_id': 'message/' + message_id,
+        '_access': None,
+        '_ownerID': 'user1',
+        '_created_at': '2017-01-01T00:00:%02dZ' % created_at,
+        'conversation': {
+            '$type': 'ref',
+            '$id': 'conversation/c1'
+        },
+        'body': 'hihi',
+        'deleted': deleted
+    })
+
+
+def keypath(name):
+    return {'$type': 'keypath', '$val': name}
+
+
+def conditions(predicate):
+    """
+    Return the comparisons in a serialized predicate.
+    """
+    if predicate[0] in ('and', 'or', 'not'):
+        return [condition for operand in predicate[1:]
+                for condition in conditions(operand)]
+    return [predicate]
+
+
+class TestFetchPageByConversationId(unittest.TestCase):
+
+    def setUp(self):
+        self.database = Mock()
+        self.patcher = patch.object(Message, '_get_database',
+                                    Mock(return_value=self.database))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_live_and_deleted_messages_in_one_query(self):
+        self.database.query.return_value = [
+            row('m5', 5, deleted=True), row('m4', 4), row('m3', 3),
+            row('m2', 2, deleted=True), row('m1', 1)
+        ]
+        messages, deleted = Message.fetch_page_by_conversation_id(
+            'c1', 2, deleted_limit=10)
+
+        self.assertEqual(self.database.query.call_count, 1)
+        query = self.database.query.call_args[0][0]
+        self.assertEqual(query.limit, 12)
+        self.assertNotIn('deleted', str(query.predicate.to_dict()))
+        self.assertEqual([m.id.key for m in messages], ['m4', 'm3'])
+        self.assertEqual([m.id.key for m in deleted], ['m5'])
+        self.assertNotIn('body', deleted[0])
+
+    def test_deleted_messages_beyond_one_query_are_kept(self):
+        rows = [row('d%d' % i, 59 - i, deleted=True) for i in range(3)]
+        rows += [row('d3', 30, deleted=True), row('m1', 10)]
+        self.database.query.side_effect = [rows[:3], rows[3:]]
+        messages, deleted = Message.fetch_page_by_conversation_id(
+            'c1', 1, deleted_limit=2)
+
+        self.assertEqual([m.id.key for m in deleted],
+                         ['d0', 'd1', 'd2', 'd3'])
+        self.assertEqual([m.id.key for m in messages], ['m1'])
+        self.assertEqual(self.database.query.call_count, 2)
+        query = self.database.query.call_args[0][0]
+        self.assertEqual(query.limit, 3)
+        predicate = query.predicate.to_dict()
+        self.assertNotIn('deleted', str(predicate))
+        self.assertIn(['lt', keypath('_id'), 'd2'], conditions(predicate))
+
+    def test_missing_edited_at_is_read_on(self):
+        rows = [row('d%d' % i, 59 - i, deleted=True) for i in range(2)]
+        self.database.query.side_effect = [rows, [row('m1', 10)]]
+        messages, deleted = Message.fetch_page_by_conversation_id(
+            'c1', 1, order='edited_at', deleted_limit=1)
+
+        self.assertEqual([m.id.key for m in messages], ['m1'])
+        predicate = self.database.query.call_args[0][0].predicate.to_dict()
+        self.assertEqual(predicate[2], [
+            'or',
+            ['and', ['eq', keypath('edited_at'), None],
+             ['lt', keypath('_id'), 'd1']],
+            ['not', ['eq', keypath('edited_at'), None]]])
+
+    def test_messages_without_deleted_flag_are_skipped(self):
+        unknown = row('m2', 2)
+        del unknown['deleted']
+        self.database.query.return_value = [unknown, row('m1', 1)]
+        messages, deleted = Message.fetch_page_by_conversation_id(
+            'c1', 2, deleted_limit=10)
+
+        self.assertEqual([m.id.key for m in messages], ['m1'])
+        self.assertEqual(deleted, [])
@@ -1,4 +1,8 @@
 import unittest
+from datetime import datetime
+
+from skygear.encoding import serialize_value
+
 from ..query import Predicate
 
 class TestPredicate(unittest.TestCase):
@@ -81,3 +85,12 @@ class TestPredicate(unittest.TestCase):
                            ["eq", {"$type": "keypath", "$val": "type"}, "frog"]]]]
         self.assertListEqual(expected, p4.to_dict())
 
+
+    def test_datetime_value_is_serialized(self):
+        p = Predicate(_updated_at__lt=datetime(2017, 1, 1, 12, 0, 0, 123456))
+        self.assertListEqual(
+            ["lt", {"$type": "keypath", "$val": "_updated_at"},
+             {"$type": "date",
+              "$date": serialize_value(datetime(2017, 1, 1, 12, 0, 0,
+                                                123456))["$date"]}],
+            p.to_dict())
@@ -3,7 +3,9 @@ from unittest.mock import Mock, patch
 
 from skygear.encoding import deserialize_record
 
-from ..pubsub import _publish_record_event
+from ..dispatcher import get_dispatcher
+from ..pubsub import (_ordering_key, _publish_record_event,
+                      _publish_record_events)
 
 
 class TestPublishEvent(unittest.TestCase):
@@ -17,15 +19,15 @@ class TestPublishEvent(unittest.TestCase):
             'body': 'hihi'
         })
 
-    @patch('chat.pubsub.Hub', autospec=True)
+    @patch('chat.pubsub.get_hub')
     @patch('chat.pubsub._get_channels_by_user_ids',
            Mock(return_value=['channel1']))
-    @patch('chat.pubsub.skyoptions',
-           Mock(return_value={'apikey': 'changeme'}))
-    def test_pubsub_publish_called(self, mock_hub):
+    def test_pubsub_publish_called(self, mock_get_hub):
         _publish_record_event('user1', 'message', 'create', self.record())
+        get_dispatcher().join()
+        mock_hub = mock_get_hub.return_value
         self.assertEqual(len(mock_hub.method_calls), 1)
-        self.assertEqual(mock_hub.method_calls[0][0], '().publish')
+        self.assertEqual(mock_hub.method_calls[0][0], 'publish')
         self.assertEqual(mock_hub.method_calls[0][1][0], ['channel1'])
         self.assertEqual(mock_hub.method_calls[0][1][1], {
             'event': 'create',
@@ -42,3 +44,34 @@ class TestPublishEvent(unittest.TestCase):
                 }
             }
         })
+
+    @patch('chat.pubsub.get_hub')
+    @patch('chat.pubsub._get_channels_by_user_ids',
+           Mock(return_value=['channel1', 'channel2']))
+    def test_pubsub_publish_many_called(self, mock_get_hub):
+        _publish_record_events(['user1', 'user2'], 'message', 'update',
+                               [self.record(), self.record()])
+        get_dispatcher().join()
+        mock_hub = mock_get_hub.return_value
+        self.assertEqual(len(mock_hub.method_calls), 1)
+        name, args, _ = mock_hub.method_calls[0]
+        self.assertEqual(name, 'publish_many')
+        self.assertEqual(args[0], ['channel1', 'channel2'])
+        self.assertEqual(len(args[1]), 2)
+        self.assertEqual(args[1][0]['event'], 'update')
+        self.assertEqual(args[1][0]['data']['record']['_id'], 'message/1')
+
+    def test_events_are_ordered_by_conversation(self):
+        message = deserialize_record({
+            '_id': 'message/1',
+            '_access': None,
+            '_ownerID': 'user1',
+            'conversation': {'$type': 'ref', '$id': 'conversation/c1'}
+        })
+        conversation = deserialize_record({
+            '_id': 'conversation/c1',
+            '_access': None,
+            '_ownerID': 'user1'
+        })
+        self.assertEqual(_ordering_key(message), 'c1')
+        self.assertEqual(_ordering_key(conversation), 'c1')
@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from skygear.encoding import deserialize_record
+
+from ..message import Message
+from ..receipt import Receipt
+from ..exc import NotInConversationException
+from ..receipt_handlers import (mark_messages, mark_messages_as_delivered,
+                                mark_messages_as_read)
+from ..user_conversation import UserConversation
+
+
+def message(message_id, conversation_id):
+    return Message.from_record(deserialize_record({
+        '_id': 'message/' + message_id,
+        '_access': None,
+        '_ownerID': 'user1',
+        'conversation': {
+            '$type': 'ref',
+            '$id': 'conversation/' + conversation_id
+        },
+        'body': 'hihi'
+    }))
+
+
+class TestMarkMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.patchers = [
+            patch('chat.receipt_handlers._get_schema_name',
+                  Mock(return_value='app_dev')),
+            patch('chat.receipt_handlers.current_user_id',
+                  Mock(return_value='user2')),
+            patch('chat.receipt._get_schema_name',
+                  Mock(return_value='app_dev')),
+            patch('chat.receipt_handlers.db.conn',
+                  Mock(return_value=MagicMock(
+                      __enter__=Mock(return_value=self.conn)))),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def test_mark_as_read_one_statement_per_conversation(self):
+        self.conn.execute.side_effect = [[('m1',), ('m2',)], [('m3',)]]
+        result = mark_messages_as_read(self.conn, [message('m1', 'c1'),
+                                                   message('m2', 'c1'),
+                                                   message('m3', 'c2')])
+        self.assertEqual(result, ['m1', 'm2', 'm3'])
+        self.assertEqual(self.conn.execute.call_count, 2)
+        params = [c[0][1] for c in self.conn.execute.call_args_list]
+        self.assertEqual([(p['conversation_id'], p['message_ids'])
+                          for p in params],
+                         [('c1', ['m1', 'm2']), ('c2', ['m3'])])
+        self.assertEqual(params[0]['user_id'], 'user2')
+
+    def test_mark_as_delivered_single_statement(self):
+        self.conn.execute.return_value = [('m1',), ('m3',)]
+        result = mark_messages_as_delivered(self.conn, ['m1', 'm2', 'm3'])
+        self.assertEqual(result, ['m1', 'm3'])
+        self.assertEqual(self.conn.execute.call_count, 1)
+        params = self.conn.execute.call_args[0][1]
+        self.assertEqual(params['message_ids'], ['m1', 'm2', 'm3'])
+        self.assertEqual(params['user_id'], 'user2')
+
+    @patch('chat.receipt_handlers.Receipt.save_all')
+    @patch('chat.receipt_handlers.UserConversation.fetch_all',
+           Mock(return_value=[Mock()]))
+    @patch('chat.receipt_handlers.Message.fetch_all',
+           Mock(return_value=[message('m1', 'c1'), message('m2', 'c1')]))
+    @patch('chat.receipt_handlers.__update_and_notify_messages')
+    @patch('chat.receipt_handlers.mark_messages_as_read',
+           Mock(return_value=['m1']))
+    @patch('chat.receipt_handlers.mark_messages_as_delivered',
+           Mock(return_value=['m1', 'm2']))
+    def test_mark_messages_creates_receipts_in_same_transaction(
+            self, mock_update_and_notify, mock_save_all):
+        mark_messages(['m1', 'm2', 'm3'], True, True)
+        self.assertFalse(mock_save_all.called)
+        sql, params = self.conn.execute.call_args_list[0][0]
+        self.assertIn('ON CONFLICT (_id) DO NOTHING', sql)
+        self.assertEqual(params['message_ids'], ['m1', 'm2'])
+        self.assertEqual(params['user_id'], 'user2')
+        self.assertEqual(params['receipt_ids'],
+                         [Receipt.consistent_id('user2', 'm1'),
+                          Receipt.consistent_id('user2', 'm2')])
+
+    @patch('chat.receipt_handlers.UserConversation.fetch_all')
+    @patch('chat.receipt_handlers.Message.fetch_all',
+           Mock(return_value=[message('m1', 'c1'), message('m2', 'c1'),
+                              message('m3', 'c2')]))
+    def test_membership_checked_once_per_conversation(self, mock_fetch_all):
+        mock_fetch_all.return_value = [Mock()]
+        with self.assertRaises(NotInConversationException):
+            mark_messages(['m1', 'm2', 'm3'], True, True)
+        self.assertEqual(mock_fetch_all.call_count, 1)
+        self.assertEqual(sorted(mock_fetch_all.call_args[0][0]), sorted([
+            UserConversation.get_consistent_hash('c1', 'user2'),
+            UserConversation.get_consistent_hash('c2', 'user2')]))
+        self.assertFalse(self.conn.execute.called)
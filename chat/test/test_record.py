@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from skygear.encoding import deserialize_record
+from skygear.utils.context import start_context
+
+from ..message import Message
+
+
+def record(key):
+    return deserialize_record({
+        '_id': 'message/' + key,
+        '_access': None,
+        '_ownerID': 'user1',
+        'body': key
+    })
+
+
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        self.database = Mock()
+        self.database.query.side_effect = self.query
+        self.patcher = patch.object(Message, '_get_database',
+                                    Mock(return_value=self.database))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def query(self, query):
+        keys = query.predicate.conditions[0][1]
+        return [record(key) for key in keys if key != 'missing']
+
+    def queried_keys(self):
+        return [sorted(c[0][0].predicate.conditions[0][1])
+                for c in self.database.query.call_args_list]
+
+    def test_fetch_served_from_memory_within_request(self):
+        with start_context({'user_id': 'user1'}):
+            m1 = Message.fetch_one('m1')
+            result = Message.fetch_all(['m2', 'm1', 'm2', 'missing'])
+            self.assertEqual([m.id.key for m in result], ['m2', 'm1'])
+            self.assertEqual(result[1]['body'], 'm1')
+        self.assertEqual(self.queried_keys(), [['m1'], ['m2', 'missing']])
+
+    def test_fetched_records_are_copies(self):
+        with start_context({'user_id': 'user1'}):
+            m1 = Message.fetch_one('m1')
+            Message.clear_message_content(m1)
+            again = Message.fetch_one('m1')
+            self.assertIsNot(again, m1)
+            self.assertEqual(again['body'], 'm1')
+        self.assertEqual(self.database.query.call_count, 1)
+
+    def test_save_and_forget_invalidate(self):
+        with start_context({'user_id': 'user1'}):
+            m1 = Message.fetch_one('m1')
+            m1.save()
+            self.assertIsNot(Message.fetch_one('m1'), m1)
+            Message.forget(['m1'])
+            Message.fetch_one('m1')
+        self.assertEqual(self.queried_keys(), [['m1'], ['m1'], ['m1']])
+
+    def test_requests_do_not_share_records(self):
+        with start_context({'user_id': 'user1'}):
+            m1 = Message.fetch_one('m1')
+        with start_context({'user_id': 'user1'}):
+            self.assertIsNot(Message.fetch_one('m1'), m1)
+        self.assertIsNot(Message.fetch_one('m1'), Message.fetch_one('m1'))
+        self.assertEqual(self.database.query.call_count, 4)
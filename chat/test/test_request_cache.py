@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from skygear.utils.context import current_context, start_context
+
+from ..dispatcher import Dispatcher
+from ..message import Message
+from ..transport import SessionTransport
+from ..utils import REQUEST_CACHE_KEY, _get_container
+
+
+@patch('chat.utils.skyoptions', Mock(masterkey='secret'))
+class TestRequestCache(unittest.TestCase):
+
+    def test_container_reused_within_request(self):
+        with start_context({'user_id': 'user1'}):
+            container = _get_container()
+            self.assertIs(_get_container(), container)
+            self.assertIs(Message._get_database().container, container)
+            self.assertIs(Message._get_database(), Message._get_database())
+        with start_context({'user_id': 'user1'}):
+            self.assertIsNot(_get_container(), container)
+
+    def test_container_not_cached_outside_request(self):
+        self.assertIsNot(_get_container(), _get_container())
+        self.assertNotIn(REQUEST_CACHE_KEY, current_context())
+
+    def test_dispatched_job_gets_own_cache(self):
+        seen = []
+        dispatcher = Dispatcher(workers=1)
+        with start_context({'user_id': 'user1'}):
+            container = _get_container()
+            dispatcher.submit(lambda: seen.append(_get_container()))
+        dispatcher.join()
+        self.assertEqual(seen[0].user_id, 'user1')
+        self.assertIsNot(seen[0], container)
+
+
+class TestSessionTransport(unittest.TestCase):
+
+    @patch('chat.transport.requests.Session')
+    def test_session_reused(self, mock_session):
+        transport = SessionTransport()
+        transport.send_action('record:query', {'action': 'record:query'},
+                              'http://localhost:3000/record/query')
+        transport.send_action('record:save', {'action': 'record:save'},
+                              'http://localhost:3000/record/save')
+        self.assertEqual(mock_session.call_count, 1)
+        post = mock_session.return_value.post
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args[0][0],
+                         'http://localhost:3000/record/save')
@@ -0,0 +1,113 @@
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from ..decorators import TYPING_STARTED_HOOK
+from ..hook_registry import HookRegistry
+from ..typing import TypingAggregator, register_typing_lambda
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@patch('chat.typing._publish_channel_event')
+class TestTypingAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.at = datetime(2017, 1, 1)
+
+    def test_repeated_event_is_dropped(self, mock_publish):
+        aggregator = TypingAggregator(window=0, dedup_window=1,
+                                      timer=self.timer)
+        self.assertTrue(aggregator.add('c1', ['ch1', 'ch2'], 'u1', 'begin',
+                                       self.at))
+        self.assertFalse(aggregator.add('c1', ['ch1', 'ch2'], 'u1', 'begin',
+                                        self.at))
+        self.assertTrue(aggregator.add('c1', ['ch1', 'ch2'], 'u1', 'pause',
+                                       self.at))
+        self.timer.now = 1
+        self.assertTrue(aggregator.add('c1', ['ch1', 'ch2'], 'u1', 'pause',
+                                       self.at))
+        self.assertEqual(mock_publish.call_count, 3)
+
+    def test_events_are_batched_per_conversation(self, mock_publish):
+        aggregator = TypingAggregator(window=10, dedup_window=1,
+                                      timer=self.timer)
+        aggregator._start = lambda: None
+        aggregator.add('c1', ['ch1', 'ch2'], 'u1', 'begin', self.at)
+        aggregator.add('c1', ['ch1', 'ch2'], 'u2', 'begin', self.at)
+        aggregator.add('c2', ['ch1'], 'u1', 'finished', self.at)
+        self.assertFalse(mock_publish.called)
+        aggregator.flush()
+
+        self.assertEqual(mock_publish.call_count, 2)
+        channels, event, data = mock_publish.call_args_list[0][0]
+        self.assertEqual((channels, event), (['ch1', 'ch2'], 'typing'))
+        self.assertEqual(sorted(data['conversation/c1'].keys()),
+                         ['user/u1', 'user/u2'])
+        self.assertEqual(data['conversation/c1']['user/u1']['event'],
+                         'begin')
+        data = mock_publish.call_args_list[1][0][2]
+        self.assertEqual(list(data['conversation/c2'].keys()), ['user/u1'])
+
+    def test_background_publish(self, mock_publish):
+        aggregator = TypingAggregator(window=0.01, dedup_window=1)
+        aggregator.add('c1', ['ch1'], 'u1', 'begin', self.at)
+        for _ in range(100):
+            if mock_publish.called:
+                break
+            time.sleep(0.01)
+        self.assertEqual(mock_publish.call_count, 1)
+
+
+class TestTypingLambda(unittest.TestCase):
+
+    def setUp(self):
+        self.ops = {}
+        self.delivery = Mock()
+        self.fetch_one = Mock(return_value={'participant_ids': ['u1', 'u2']})
+        self.patchers = [
+            patch('chat.typing.skygear.op', self.op),
+            patch('chat.typing.current_user_id', Mock(return_value='u1')),
+            patch('chat.typing.fetch_participant_channels',
+                  Mock(return_value=(['u1', 'u2'], ['ch1', 'ch2']))),
+            patch('chat.typing._typing_aggregator',
+                  Mock(add=Mock(return_value=True))),
+            patch('chat.typing.Conversation', Mock(fetch_one=self.fetch_one)),
+            patch('chat.typing.serialize_record', Mock(return_value='c1')),
+            patch('chat.hook_registry._hook_registry',
+                  HookRegistry(external=['*'])),
+            patch('chat.hook_delivery._hook_delivery', self.delivery),
+            patch('chat.hooks.get_users', Mock(return_value=[])),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+        register_typing_lambda(None)
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def op(self, name, **kwargs):
+        def decorator(fn):
+            self.ops[name] = fn
+            return fn
+        return decorator
+
+    def test_conversation_is_loaded_on_delivery(self):
+        self.ops['chat:typing']('c1', 'begin', '2017-01-01T00:00:00.000Z')
+        self.assertFalse(self.fetch_one.called)
+
+        name, build_args = self.delivery.send.call_args[0]
+        self.assertEqual(name, TYPING_STARTED_HOOK)
+        args = build_args()
+        self.fetch_one.assert_called_once_with('c1')
+        self.assertEqual(args['conversation'], 'c1')
+        self.assertEqual(args['events'], 'begin')
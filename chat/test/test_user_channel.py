@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from ..cache import LRUCache
+from ..utils import _get_channels_by_user_ids, invalidate_user_channels
+
+
+class TestGetChannelsByUserIds(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.execute.side_effect = self.execute
+        self.rows = {'user1': ['channel1'], 'user2': ['channel2']}
+        self.patchers = [
+            patch('chat.utils._get_schema_name', Mock(return_value='app_dev')),
+            patch('chat.utils._user_channel_cache', LRUCache()),
+            patch('chat.utils.db.conn',
+                  Mock(return_value=MagicMock(
+                      __enter__=Mock(return_value=self.conn)))),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def execute(self, sql, params):
+        return [(user_id, name)
+                for user_id in params['user_ids']
+                for name in self.rows.get(user_id, [])]
+
+    def test_lookup_is_cached(self):
+        self.assertEqual(_get_channels_by_user_ids(['user1', 'user2']),
+                         ['channel1', 'channel2'])
+        self.assertEqual(_get_channels_by_user_ids(['user2', 'user1']),
+                         ['channel2', 'channel1'])
+        self.assertEqual(self.conn.execute.call_count, 1)
+
+    def test_only_missing_users_are_queried(self):
+        _get_channels_by_user_ids(['user1'])
+        self.assertEqual(_get_channels_by_user_ids(['user1', 'user2', 'user3']),
+                         ['channel1', 'channel2'])
+        self.assertEqual(self.conn.execute.call_args[0][1]['user_ids'],
+                         ('user2', 'user3'))
+
+    def test_invalidate_refetches_channel(self):
+        _get_channels_by_user_ids(['user1'])
+        self.rows['user1'] = ['channel1b']
+        invalidate_user_channels(['user1'])
+        self.assertEqual(_get_channels_by_user_ids(['user1']), ['channel1b'])
+        self.assertEqual(self.conn.execute.call_count, 2)
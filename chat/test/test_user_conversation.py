@@ -1,9 +1,18 @@
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
-from skygear.encoding import deserialize_record
+from skygear.encoding import deserialize_record, serialize_value
+from skygear.utils import db
 from ..conversation import Conversation
-from ..user_conversation import UserConversation
+from ..exc import SkygearChatException
+from ..cache import LRUCache
+from ..utils import invalidate_user_channels
+from ..user_conversation import (UserConversation, _decode_cursor,
+                                 _encode_cursor, bump_membership_version,
+                                 fetch_participant_channels,
+                                 invalidate_memberships, participant_hash,
+                                 refresh_participant_summary,
+                                 update_participant_summary)
 
 
 class TestUserConversation(unittest.TestCase):
@@ -38,3 +47,304 @@ class TestUserConversation(unittest.TestCase):
         r3 = uc3.get_hash()
         self.assertEqual(str(r1), str(r2))
         self.assertNotEqual(str(r1), str(r3))
+
+
+class TestUpdateParticipantSummary(unittest.TestCase):
+
+    def test_participant_hash_ignores_order_and_duplicates(self):
+        self.assertEqual(participant_hash(['user2', 'user1', 'user2']),
+                         participant_hash(['user1', 'user2']))
+        self.assertNotEqual(participant_hash(['user1', 'user2']),
+                            participant_hash(['user1', 'user3']))
+
+    @patch('chat.user_conversation._get_schema_name',
+           Mock(return_value='app_dev'))
+    def test_recount_participants(self):
+        conn = Mock()
+        update_participant_summary(conn, {'c1', 'c2'})
+        self.assertEqual(conn.execute.call_count, 1)
+        self.assertEqual(
+            sorted(conn.execute.call_args[0][1]['conversation_ids']),
+            ['c1', 'c2'])
+
+    def test_no_conversation(self):
+        conn = Mock()
+        update_participant_summary(conn, [])
+        self.assertFalse(conn.execute.called)
+
+    @patch('chat.user_conversation._get_schema_name',
+           Mock(return_value='app_dev'))
+    @patch('chat.user_conversation.db.conn')
+    def test_refresh_locks_conversations_before_recount(self, mock_conn):
+        conn = mock_conn.return_value.__enter__.return_value
+        refresh_participant_summary(['c2', 'c1', 'c2'])
+        self.assertEqual(mock_conn.call_count, 1)
+        self.assertEqual(conn.execute.call_count, 2)
+        lock, recount = conn.execute.call_args_list
+        self.assertIn('FOR UPDATE', lock[0][0])
+        self.assertEqual(lock[0][1]['conversation_ids'], ['c1', 'c2'])
+        self.assertIn('UPDATE', recount[0][0])
+        self.assertEqual(recount[0][1]['conversation_ids'], ['c1', 'c2'])
+
+    @patch('chat.user_conversation.db.conn')
+    def test_refresh_no_conversation(self, mock_conn):
+        refresh_participant_summary([])
+        self.assertFalse(mock_conn.called)
+
+
+class TestFetchMembers(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.execute.side_effect = self.execute
+        self.versions = {'c1': 1.0, 'c2': 1.0}
+        self.rows = [('c1', 'user1', True), ('c1', 'user2', False),
+                     ('c2', 'user1', False)]
+        self.member_queries = []
+        self.patchers = [
+            patch('chat.user_conversation._get_schema_name',
+                  Mock(return_value='app_dev')),
+            patch('chat.user_conversation._membership_cache', LRUCache()),
+            patch('chat.user_conversation._typing_membership_cache',
+                  LRUCache()),
+            patch('chat.user_conversation.db.conn',
+                  Mock(return_value=MagicMock(
+                      __enter__=Mock(return_value=self.conn)))),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def execute(self, sql, params):
+        conversation_ids = params['conversation_ids']
+        if 'membership_version' in sql:
+            return [(conversation_id, self.versions[conversation_id])
+                    for conversation_id in conversation_ids
+                    if conversation_id in self.versions]
+        self.member_queries.append(conversation_ids)
+        return [row for row in self.rows if row[0] in conversation_ids]
+
+    def test_members_are_cached(self):
+        members = UserConversation.fetch_members(['c1', 'c3'])
+        self.assertEqual(members, {
+            'c1': {'participant_ids': ['user1', 'user2'],
+                   'admin_ids': ['user1']},
+            'c3': {'participant_ids': [], 'admin_ids': []}
+        })
+        members['c1']['participant_ids'].append('user3')
+        self.assertEqual(UserConversation.fetch_participant_ids(['c1', 'c2']),
+                         {'c1': ['user1', 'user2'], 'c2': ['user1']})
+        self.assertEqual(self.member_queries, [['c1', 'c3'], ['c2']])
+
+    def test_version_change_refetches_members(self):
+        UserConversation.fetch_members(['c1', 'c2'])
+        # committed by another process, which cannot invalidate our cache
+        self.rows.append(('c1', 'user3', False))
+        self.versions['c1'] = 2.0
+        self.assertEqual(UserConversation.fetch_participant_ids(['c1', 'c2']),
+                         {'c1': ['user1', 'user2', 'user3'],
+                          'c2': ['user1']})
+        self.assertEqual(self.member_queries, [['c1', 'c2'], ['c1']])
+
+    def test_invalidate_refetches_members(self):
+        UserConversation.fetch_members(['c1'])
+        self.rows.append(('c1', 'user3', False))
+        invalidate_memberships(['c1'])
+        self.assertEqual(
+            UserConversation.fetch_participant_ids(['c1'])['c1'],
+            ['user1', 'user2', 'user3'])
+        self.assertEqual(len(self.member_queries), 2)
+
+    def test_no_conversation(self):
+        self.assertEqual(UserConversation.fetch_members([]), {})
+        self.assertFalse(self.conn.execute.called)
+
+
+class TestBumpMembershipVersion(unittest.TestCase):
+
+    @patch('chat.user_conversation._get_schema_name',
+           Mock(return_value='app_dev'))
+    def test_bump(self):
+        conn = Mock()
+        bump_membership_version(conn, ['c1'])
+        self.assertEqual(conn.execute.call_count, 1)
+        self.assertIn('SET membership_version', conn.execute.call_args[0][0])
+        self.assertEqual(conn.execute.call_args[0][1]['conversation_ids'],
+                         ['c1'])
+
+    def test_no_conversation(self):
+        conn = Mock()
+        bump_membership_version(conn, [])
+        self.assertFalse(conn.execute.called)
+
+
+class TestFetchParticipantChannels(unittest.TestCase):
+
+    def setUp(self):
+        self.patchers = [
+            patch.object(UserConversation, 'fetch_participant_ids',
+                         Mock(return_value={'c1': ['user1', 'user2']})),
+            patch('chat.utils._get_schema_name',
+                  Mock(return_value='app_dev')),
+            patch('chat.utils._user_channel_cache', LRUCache()),
+            patch('chat.user_conversation._membership_cache', LRUCache()),
+            patch('chat.user_conversation._typing_membership_cache',
+                  LRUCache(ttl=5)),
+            patch('chat.utils.db.conn',
+                  Mock(return_value=MagicMock(
+                      __enter__=Mock(return_value=MagicMock(
+                          execute=Mock(return_value=[
+                              ('user1', 'channel1'),
+                              ('user1', 'channel1b')]))))))
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def test_channels_of_participants(self):
+        expected = (['user1', 'user2'], ['channel1', 'channel1b'])
+        self.assertEqual(fetch_participant_channels('c1'), expected)
+        self.assertEqual(fetch_participant_channels('c1'), expected)
+        UserConversation.fetch_participant_ids.assert_called_with(['c1'])
+        conn = db.conn.return_value.__enter__.return_value
+        self.assertEqual(conn.execute.call_count, 1)
+
+    def test_participants_are_kept_without_version_check(self):
+        fetch_participant_channels('c1')
+        fetch_participant_channels('c1')
+        self.assertEqual(UserConversation.fetch_participant_ids.call_count, 1)
+
+    def test_membership_change_is_seen(self):
+        fetch_participant_channels('c1')
+        UserConversation.fetch_participant_ids.return_value = \
+            {'c1': ['user1']}
+        invalidate_memberships(['c1'])
+        self.assertEqual(fetch_participant_channels('c1'),
+                         (['user1'], ['channel1', 'channel1b']))
+
+    def test_user_channel_change_is_seen(self):
+        fetch_participant_channels('c1')
+        conn = db.conn.return_value.__enter__.return_value
+        conn.execute.return_value = [('user2', 'channel2')]
+        invalidate_user_channels(['user2'])
+        self.assertEqual(fetch_participant_channels('c1'),
+                         (['user1', 'user2'],
+                          ['channel1', 'channel1b', 'channel2']))
+
+
+class TestFetchExistingUserIds(unittest.TestCase):
+
+    @patch.object(UserConversation, '_get_database')
+    def test_one_query_by_consistent_hash(self, mock_get_database):
+        conversation = Conversation.new('c1', 'user1')
+        uc = UserConversation.new(conversation, 'user2')
+        database = mock_get_database.return_value
+        database.query.return_value = [uc]
+
+        self.assertEqual(UserConversation.fetch_existing_user_ids(
+            'c1', ['user1', 'user2', 'user3']), ['user2'])
+        self.assertEqual(database.query.call_count, 1)
+        keys = database.query.call_args[0][0].predicate.conditions[0][1]
+        self.assertEqual(sorted(keys), sorted(
+            UserConversation.get_consistent_hash('c1', user_id)
+            for user_id in ['user1', 'user2', 'user3']))
+
+
+class TestMarkAllAdmin(unittest.TestCase):
+
+    @patch.object(UserConversation, '_get_database')
+    def test_one_save_by_consistent_hash(self, mock_get_database):
+        conversation = Conversation.new('c1', 'user1')
+        database = mock_get_database.return_value
+        UserConversation.mark_all_admin(conversation,
+                                        ['user1', 'user2', 'user1'], True)
+
+        self.assertEqual(database.save.call_count, 1)
+        records = database.save.call_args[0][0]
+        self.assertTrue(database.save.call_args[1]['atomic'])
+        self.assertEqual(
+            [r.id.key for r in records],
+            [UserConversation.get_consistent_hash('c1', 'user1'),
+             UserConversation.get_consistent_hash('c1', 'user2')])
+        self.assertEqual([r['user'].recordID.key for r in records],
+                         ['user1', 'user2'])
+        self.assertTrue(all(r['is_admin'] for r in records))
+        self.assertFalse(database.query.called)
+
+    @patch.object(UserConversation, '_get_database')
+    def test_no_user(self, mock_get_database):
+        UserConversation.mark_all_admin(Conversation.new('c1', 'user1'),
+                                        [], False)
+        self.assertFalse(mock_get_database.return_value.save.called)
+
+
+class TestFetchAllWithCursor(unittest.TestCase):
+
+    def setUp(self):
+        self.database = Mock()
+        self.patchers = [
+            patch('chat.user_conversation.current_user_id',
+                  Mock(return_value='user1')),
+            patch.object(UserConversation, '_get_database',
+                         Mock(return_value=self.database)),
+        ]
+        for each_patcher in self.patchers:
+            each_patcher.start()
+
+    def tearDown(self):
+        for each_patcher in self.patchers:
+            each_patcher.stop()
+
+    def user_conversation(self, key, updated_at):
+        return deserialize_record({
+            '_id': 'user_conversation/' + key,
+            '_access': None,
+            '_ownerID': 'user1',
+            '_updated_at': updated_at,
+        })
+
+    def test_first_page_has_next_cursor(self):
+        self.database.query.return_value = [
+            self.user_conversation('uc3', '2017-01-03T00:00:00.000003Z'),
+            self.user_conversation('uc2', '2017-01-02T00:00:00.000002Z'),
+            self.user_conversation('uc1', '2017-01-01T00:00:00.000001Z'),
+        ]
+        result, next_cursor = UserConversation.fetch_all_with_cursor(None, 2)
+        self.assertEqual([r.id.key for r in result], ['uc3', 'uc2'])
+        query = self.database.query.call_args[0][0]
+        self.assertEqual(query.limit, 3)
+        self.assertEqual([s[0]['$val'] for s in query.sort],
+                         ['_updated_at', '_id'])
+
+        updated_at, record_id = _decode_cursor(next_cursor)
+        self.assertEqual(record_id, 'uc2')
+        self.assertEqual(updated_at, result[1].updated_at)
+
+    def test_seek_after_cursor(self):
+        self.database.query.return_value = []
+        record = self.user_conversation('uc2', '2017-01-02T00:00:00.000002Z')
+        result, next_cursor = UserConversation.fetch_all_with_cursor(
+            _encode_cursor(record), 2)
+        self.assertEqual(result, [])
+        self.assertIsNone(next_cursor)
+        date = serialize_value(record.updated_at)
+        query = self.database.query.call_args[0][0]
+        self.assertEqual(query.predicate.to_dict(), [
+            'and',
+            ['eq', {'$type': 'keypath', '$val': 'user'}, 'user1'],
+            ['or',
+             ['lt', {'$type': 'keypath', '$val': '_updated_at'}, date],
+             ['and',
+              ['lt', {'$type': 'keypath', '$val': '_id'}, 'uc2'],
+              ['eq', {'$type': 'keypath', '$val': '_updated_at'}, date]]]
+        ])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(SkygearChatException):
+            UserConversation.fetch_all_with_cursor('not a cursor', 2)
@@ -0,0 +1,69 @@
+# Copyright 2017 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import threading
+
+import requests
+
+from skygear.__version__ import __version__
+from skygear.container import PayloadEncoder, SkygearContainer
+from skygear.transmitter.http import HttpTransport
+
+_session_transport = None
+_session_transport_lock = threading.Lock()
+
+
+def get_container_transport():
+    """
+    Return the transport chat containers send actions with.
+
+    When the plugin talks to Skygear over HTTP, actions are sent through
+    keep-alive sessions instead of opening a new connection per action.
+    Other transports, such as ZeroMQ, are returned as is.
+    """
+    global _session_transport
+    transport = SkygearContainer.transport
+    if not isinstance(transport, HttpTransport):
+        return transport
+    with _session_transport_lock:
+        if _session_transport is None:
+            _session_transport = SessionTransport()
+    return _session_transport
+
+
+class SessionTransport:
+    """
+    Send container actions over HTTP with one keep-alive session per
+    thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'Content-type': 'application/json',
+                'Accept': 'application/json',
+                'X-Skygear-SDK-Version': 'py-skygear/' + __version__
+            })
+            self._local.session = session
+        return session
+
+    def send_action(self, action_name, payload, url, timeout=60):
+        data = json.dumps(payload, cls=PayloadEncoder)
+        return self.session.post(url, data=data, timeout=timeout).json()
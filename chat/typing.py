@@ -1,42 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 from strict_rfc3339 import timestamp_to_rfc3339_utcoffset
 
 import skygear
 from skygear.encoding import _RecordEncoder, serialize_record
+from skygear.models import RecordID
+from skygear.settings import settings
 from skygear.utils.context import current_user_id
 
+from .cache import LRUCache
 from .conversation import Conversation
 from .exc import SkygearChatException
 from .hooks import send_typing_started_hook
-from .pubsub import _publish_event
+from .pubsub import _publish_channel_event
+from .user_conversation import fetch_participant_channels
 
+_typing_aggregator = None
+_typing_aggregator_lock = threading.Lock()
 
-def publish_typing(conversation, evt, at):
+
+def get_typing_aggregator():
+    global _typing_aggregator
+    with _typing_aggregator_lock:
+        if _typing_aggregator is None:
+            _typing_aggregator = TypingAggregator(
+                window=settings.chat.typing_batch_window,
+                dedup_window=settings.chat.typing_dedup_window)
+    return _typing_aggregator
+
+
+class TypingAggregator(object):
     """
-    {
-      'userid': {
-        'event': 'begin',
-        'at': '20161116T78:44:00Z'
-      },
-      'userid2': {
-        'event': 'begin',
-        'at': '20161116T78:44:00Z'
-      }
-    }
+    Coalesce typing events before publishing them.
+
+    An event repeating the last event of the same user in the same
+    conversation within `dedup_window` seconds is dropped. Events of a
+    conversation received within `window` seconds of its first pending
+    event are published together in one typing event, keyed by user, by a
+    background thread. With `window=0` events are published immediately.
     """
-    user_id = current_user_id()
-    channels = conversation['participant_ids']
-    data = {}
-    data['user/' + user_id] = {
-        'event': evt,
-        'at': timestamp_to_rfc3339_utcoffset(at.timestamp())
-    }
-    encoder = _RecordEncoder()
-    _publish_event(channels, 'typing', {
-        encoder.encode_id(conversation.id): data
-    })
-    return {'status': 'OK'}
+
+    def __init__(self, window=0.2, dedup_window=0.5, maxsize=10000,
+                 timer=time.monotonic):
+        self.window = window
+        self.timer = timer
+        self._last_events = LRUCache(maxsize=maxsize, ttl=dedup_window,
+                                     timer=timer)
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, conversation_id, channels, user_id, evt, at):
+        """
+        Queue a typing event for the user channels of the participants.
+        Returns False if the event is dropped as a repeat of the previous
+        event.
+        """
+        key = (conversation_id, user_id)
+        if self._last_events.get(key) == evt:
+            return False
+        self._last_events.set(key, evt)
+
+        state = {'event': evt,
+                 'at': timestamp_to_rfc3339_utcoffset(at.timestamp())}
+        if self.window <= 0:
+            self._publish(conversation_id, channels,
+                          {'user/' + user_id: state})
+            return True
+
+        with self._cond:
+            pending = self._pending.get(conversation_id)
+            if pending is None:
+                pending = {'due': self.timer() + self.window, 'data': {}}
+                self._pending[conversation_id] = pending
+                self._cond.notify()
+            pending['channels'] = channels
+            pending['data']['user/' + user_id] = state
+            self._start()
+        return True
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work,
+                                            name='chat-typing',
+                                            daemon=True)
+            self._thread.start()
+
+    def _pop_due(self, now):
+        due = []
+        # conversations are queued in the order they become due
+        while self._pending:
+            conversation_id, pending = next(iter(self._pending.items()))
+            if pending['due'] > now:
+                break
+            del self._pending[conversation_id]
+            due.append((conversation_id, pending))
+        return due
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = self.timer()
+                due = self._pop_due(now)
+                if not due:
+                    first = next(iter(self._pending.values()))
+                    self._cond.wait(first['due'] - now)
+                    continue
+            for conversation_id, pending in due:
+                self._publish(conversation_id,
+                              pending['channels'],
+                              pending['data'])
+
+    def flush(self):
+        """
+        Publish every pending typing event now.
+        """
+        with self._cond:
+            due = self._pop_due(float('inf'))
+        for conversation_id, pending in due:
+            self._publish(conversation_id,
+                          pending['channels'],
+                          pending['data'])
+
+    def _publish(self, conversation_id, channels, data):
+        encoder = _RecordEncoder()
+        record_id = RecordID(Conversation.record_type, conversation_id)
+        _publish_channel_event(channels, 'typing', {
+            encoder.encode_id(record_id): data
+        }, key=conversation_id)
 
 
 def register_typing_lambda(settings):
@@ -49,10 +145,22 @@ def register_typing_lambda(settings):
             dt = datetime.strptime(at, '%Y-%m-%dT%H:%M:%S.%fZ')
         except ValueError:
             raise SkygearChatException('Event time is not in correct format')
-        c = Conversation.fetch_one(conversation_id)
-        serialized_conversation = serialize_record(c)
-        participant_ids = serialized_conversation['participant_ids']
-        send_typing_started_hook(serialized_conversation,
-                                 participant_ids,
-                                 evt)
-        return publish_typing(c, evt, dt)
+
+        # membership and channels are read with one cached lookup
+        user_id = current_user_id()
+        participant_ids, channels = \
+            fetch_participant_channels(conversation_id)
+        if user_id not in participant_ids:
+            msg = "Conversation not found,conversation_id=%s" %\
+                  (conversation_id)
+            raise SkygearChatException(msg)
+
+        aggregator = get_typing_aggregator()
+        if not aggregator.add(conversation_id, channels, user_id, evt, dt):
+            return {'status': 'OK'}
+        # the conversation is loaded on the hook delivery thread
+        send_typing_started_hook(
+            lambda: serialize_record(Conversation.fetch_one(conversation_id)),
+            participant_ids,
+            evt)
+        return {'status': 'OK'}
@@ -0,0 +1,13 @@
+import skygear
+
+from .hooks import invalidate_users
+
+
+def register_user_hooks(settings):
+    @skygear.after_save("user", async=True)
+    def user_after_save_handler(record, original_record, db):
+        invalidate_users([record.id.key])
+
+    @skygear.after_delete("user", async=True)
+    def user_after_delete_handler(record, db):
+        invalidate_users([record.id.key])
@@ -0,0 +1,13 @@
+import skygear
+
+from .utils import invalidate_user_channels
+
+
+def register_user_channel_hooks(settings):
+    @skygear.after_save("user_channel", async=False)
+    def user_channel_after_save_handler(record, original_record, conn):
+        invalidate_user_channels([record.owner_id])
+
+    @skygear.after_delete("user_channel", async=False)
+    def user_channel_after_delete_handler(record, conn):
+        invalidate_user_channels([record.owner_id])
@@ -1,17 +1,58 @@
+import base64
+import binascii
 import hashlib
+import json
+import threading
 import uuid
 
 from psycopg2.extensions import AsIs
 
 import skygear
+from skygear.encoding import deserialize_value, serialize_value
 from skygear.models import Record, RecordID, Reference
+from skygear.settings import settings
 from skygear.utils import db
 from skygear.utils.context import current_user_id
 
+from .cache import LRUCache, create_cache
+from .exc import InvalidArgumentException
 from .predicate import Predicate
 from .query import Query
 from .record import ChatRecord
-from .utils import _get_schema_name
+from .utils import _get_channels_by_user_ids, _get_schema_name
+
+_membership_cache = None
+_membership_cache_lock = threading.Lock()
+
+
+def get_membership_cache():
+    global _membership_cache
+    with _membership_cache_lock:
+        if _membership_cache is None:
+            _membership_cache = create_cache(
+                settings.chat.membership_cache_backend,
+                maxsize=settings.chat.membership_cache_size,
+                ttl=settings.chat.membership_cache_ttl)
+    return _membership_cache
+
+
+_typing_membership_cache = None
+_typing_membership_cache_lock = threading.Lock()
+
+
+def get_typing_membership_cache():
+    global _typing_membership_cache
+    with _typing_membership_cache_lock:
+        if _typing_membership_cache is None:
+            _typing_membership_cache = LRUCache(
+                maxsize=settings.chat.membership_cache_size,
+                ttl=settings.chat.typing_membership_ttl)
+    return _typing_membership_cache
+
+
+def invalidate_memberships(conversation_ids):
+    get_membership_cache().delete_many(conversation_ids)
+    get_typing_membership_cache().delete_many(conversation_ids)
 
 
 class UserConversation(ChatRecord):
@@ -40,6 +81,33 @@ class UserConversation(ChatRecord):
         record['user'] = self['user']
         record['conversation'] = self['conversation']
         database.save([record])
+        self.forget([self])
+
+    @classmethod
+    def mark_all_admin(cls, conversation, user_ids, flag):
+        """
+        Set the admin flag of the given users in the conversation with one
+        save. User conversations are addressed by their consistent hash
+        ids, so they are not fetched first; users who are not yet
+        participants are added to the conversation.
+        """
+        records = []
+        for user_id in dict.fromkeys(user_ids):
+            record = Record(
+                RecordID(cls.record_type,
+                         cls.get_consistent_hash(conversation.id.key,
+                                                 user_id)),
+                user_id,
+                conversation.get_user_conversation_acl())
+            record['is_admin'] = flag
+            record['user'] = Reference(RecordID('user', user_id))
+            record['conversation'] = Reference(conversation.id)
+            records.append(record)
+        if len(records) == 0:
+            return
+        database = cls._get_database()
+        database.save(records, atomic=True)
+        cls.forget(records)
 
     @classmethod
     def get_consistent_hash(cls, conversation_id, user_id):
@@ -57,6 +125,20 @@ class UserConversation(ChatRecord):
         return (record is not None) and\
                (not check_is_admin or record['is_admin'])
 
+    @classmethod
+    def fetch_existing_user_ids(cls, conversation_id, user_ids):
+        """
+        Return the ids of the given users that are participants of the
+        conversation, in the given order. User conversations are looked
+        up by their consistent hash in one query.
+        """
+        keys = [cls.get_consistent_hash(conversation_id, user_id)
+                for user_id in user_ids]
+        if len(keys) == 0:
+            return []
+        existing = {uc['user'].recordID.key for uc in cls.fetch_all(keys)}
+        return [user_id for user_id in user_ids if user_id in existing]
+
     @classmethod
     def fetch_all_with_paging(cls, page, page_size, order='desc'):
         database = cls._get_database()
@@ -70,6 +152,36 @@ class UserConversation(ChatRecord):
                        .add_order('_updated_at', order))
         return [uc for uc in query_result]
 
+    @classmethod
+    def fetch_all_with_cursor(cls, cursor, page_size, order='desc'):
+        """
+        Fetch a page of the current user's conversations ordered by
+        `_updated_at` and `_id`, starting after `cursor`. Returns the page
+        and the cursor of the next page, which is None on the last page.
+        """
+        database = cls._get_database()
+        predicate = Predicate(user__eq=current_user_id())
+        if cursor is not None:
+            updated_at, record_id = _decode_cursor(cursor)
+            op = 'lt' if order == 'desc' else 'gt'
+            predicate = predicate & (
+                Predicate(**{'_updated_at__' + op: updated_at}) |
+                Predicate(**{'_updated_at__eq': updated_at,
+                             '_id__' + op: record_id}))
+        query_result = database.query(
+                       Query(cls.record_type,
+                             predicate=predicate,
+                             limit=page_size + 1,
+                             include=["conversation", "user"])
+                       .add_order('_updated_at', order)
+                       .add_order('_id', order))
+        result = [uc for uc in query_result]
+        next_cursor = None
+        if len(result) > page_size:
+            result = result[:page_size]
+            next_cursor = _encode_cursor(result[-1])
+        return result, next_cursor
+
     @classmethod
     def fetch_all_by_conversation_id(cls, conversation_id):
         database = cls._get_database()
@@ -80,6 +192,55 @@ class UserConversation(ChatRecord):
                                        limit=None))
         return [UserConversation.from_record(record) for record in records]
 
+    @classmethod
+    def fetch_members(cls, conversation_ids):
+        """
+        Return a dict of the participant and admin user ids of each
+        conversation, keyed by conversation id.
+
+        Members are cached per conversation id together with the
+        membership version of the conversation. The versions are read from
+        the conversation rows on every call, and only the conversations
+        missing from the cache or cached with another version are looked
+        up from user_conversation, so that a membership change committed
+        by any process is seen at once.
+        """
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if len(conversation_ids) == 0:
+            return {}
+        cache = get_membership_cache()
+        with db.conn() as conn:
+            versions = _fetch_membership_versions(conn, conversation_ids)
+            members = {conversation_id: member
+                       for conversation_id, member
+                       in cache.get_many(conversation_ids).items()
+                       if member['version'] == versions.get(conversation_id)}
+            missing = [conversation_id for conversation_id in conversation_ids
+                       if conversation_id not in members]
+            if missing:
+                fetched = _load_members(conn, missing, versions)
+                cache.set_many(fetched)
+                members.update(fetched)
+
+        # copy the lists so that callers cannot modify the cached values
+        result = {}
+        for conversation_id in conversation_ids:
+            member = members[conversation_id]
+            result[conversation_id] = {
+                'participant_ids': list(member['participant_ids']),
+                'admin_ids': list(member['admin_ids'])
+            }
+        return result
+
+    @classmethod
+    def fetch_participant_ids(cls, conversation_ids):
+        """
+        Return a dict of participant user ids keyed by conversation id.
+        """
+        members = cls.fetch_members(conversation_ids)
+        return {conversation_id: member['participant_ids']
+                for conversation_id, member in members.items()}
+
     @classmethod
     def fetch_one(cls,
                   conversation_id,
@@ -98,6 +259,88 @@ class UserConversation(ChatRecord):
             if len(query_result) == 1 else None
 
 
+def _fetch_membership_versions(conn, conversation_ids):
+    """
+    Return the membership version of each existing conversation, keyed by
+    conversation id.
+    """
+    cur = conn.execute('''
+        SELECT _id, COALESCE(membership_version, 0)
+        FROM %(schema_name)s.conversation
+        WHERE _id = ANY(%(conversation_ids)s)
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'conversation_ids': conversation_ids
+        }
+    )
+    return {row[0]: row[1] for row in cur}
+
+
+def _load_members(conn, conversation_ids, versions):
+    """
+    Read the participant and admin user ids of the conversations from
+    user_conversation, tagged with the given membership versions.
+    """
+    members = {conversation_id: {
+        'version': versions.get(conversation_id, 0),
+        'participant_ids': [],
+        'admin_ids': []
+    } for conversation_id in conversation_ids}
+    cur = conn.execute('''
+        SELECT conversation, "user", is_admin
+        FROM %(schema_name)s.user_conversation
+        WHERE conversation = ANY(%(conversation_ids)s)
+        ORDER BY _created_at, _id
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'conversation_ids': conversation_ids
+        }
+    )
+    for conversation_id, user_id, is_admin in cur:
+        member = members[conversation_id]
+        member['participant_ids'].append(user_id)
+        if is_admin:
+            member['admin_ids'].append(user_id)
+    return members
+
+
+def _encode_cursor(record):
+    data = json.dumps([serialize_value(record.updated_at)['$date'],
+                       record.id.key])
+    return base64.urlsafe_b64encode(data.encode('utf8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        updated_at, record_id = json.loads(data.decode('utf8'))
+        updated_at = deserialize_value({'$type': 'date', '$date': updated_at})
+    except (AttributeError, TypeError, ValueError, binascii.Error):
+        raise InvalidArgumentException('Invalid cursor', ['cursor'])
+    return updated_at, record_id
+
+
+def fetch_participant_channels(conversation_id):
+    """
+    Return the participant ids and the user channel names of the
+    participants of a conversation.
+
+    Participants are kept for `typing_membership_ttl` seconds without
+    checking the membership version of the conversation, so membership
+    changes made by other processes are seen after at most that long.
+    Channels are read from the user channel cache, which the user_channel
+    hooks invalidate.
+    """
+    cache = get_typing_membership_cache()
+    participant_ids = cache.get(conversation_id)
+    if participant_ids is None:
+        participant_ids = \
+            UserConversation.fetch_participant_ids([conversation_id])[
+                conversation_id]
+        cache.set(conversation_id, participant_ids)
+    return list(participant_ids), _get_channels_by_user_ids(participant_ids)
+
+
 def total_unread(user_id=None):
     if user_id is None:
         user_id = current_user_id()
@@ -122,6 +365,108 @@ def total_unread(user_id=None):
     }
 
 
+def participant_hash(user_ids):
+    """
+    Return the fingerprint of a set of participants, which is the MD5 of
+    the sorted distinct user ids joined by commas. It must match the
+    fingerprint computed in SQL by update_participant_summary.
+    """
+    data = ','.join(sorted(set(user_ids)))
+    return hashlib.md5(bytes(data, 'utf8')).hexdigest()
+
+
+def update_participant_summary(conn, conversation_ids):
+    """
+    Store the current number and fingerprint of participants on each
+    conversation, so that message status can be derived without counting
+    user_conversation rows, and conversations with the same participants
+    can be found by an indexed lookup.
+    """
+    if len(conversation_ids) == 0:
+        return
+    conn.execute('''
+        UPDATE %(schema_name)s.conversation c
+        SET participant_count = s.count, participant_hash = s.hash
+        FROM (
+            SELECT c2._id,
+                COUNT(uc._id) AS count,
+                md5(COALESCE(
+                    string_agg(uc.user, ',' ORDER BY uc.user COLLATE "C"),
+                    '')) AS hash
+            FROM %(schema_name)s.conversation c2
+            LEFT JOIN %(schema_name)s.user_conversation uc
+                ON uc.conversation = c2._id
+            WHERE c2._id = ANY(%(conversation_ids)s)
+            GROUP BY c2._id
+        ) s
+        WHERE c._id = s._id
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'conversation_ids': list(conversation_ids)
+        }
+    )
+
+
+def refresh_participant_summary(conversation_ids):
+    """
+    Recount the participants of each conversation after its membership
+    has been changed and committed, once per change instead of once per
+    user_conversation row.
+
+    The conversation rows are locked before the recount, so concurrent
+    refreshes of a conversation run one after the other, and each recount
+    reads the memberships committed before it started.
+    """
+    conversation_ids = sorted(set(conversation_ids))
+    if len(conversation_ids) == 0:
+        return
+    with db.conn() as conn:
+        conn.execute('''
+            SELECT _id FROM %(schema_name)s.conversation
+            WHERE _id = ANY(%(conversation_ids)s)
+            ORDER BY _id
+            FOR UPDATE
+            ''', {
+                'schema_name': AsIs(_get_schema_name()),
+                'conversation_ids': conversation_ids
+            }
+        )
+        update_participant_summary(conn, conversation_ids)
+
+
+def bump_membership_version(conn, conversation_ids):
+    """
+    Increment the membership version of each conversation. Membership
+    cache entries of another version are not used, so running this in the
+    transaction that changes the membership makes every plugin process
+    stop using its cached members as soon as the change is committed.
+    """
+    if len(conversation_ids) == 0:
+        return
+    conn.execute('''
+        UPDATE %(schema_name)s.conversation
+        SET membership_version = COALESCE(membership_version, 0) + 1
+        WHERE _id = ANY(%(conversation_ids)s)
+        ''', {
+            'schema_name': AsIs(_get_schema_name()),
+            'conversation_ids': list(conversation_ids)
+        }
+    )
+
+
+def register_user_conversation_hooks(settings):
+    @skygear.after_save("user_conversation", async=False)
+    def user_conversation_after_save_handler(record, original_record, conn):
+        if original_record is None or \
+                original_record.get('is_admin') != record.get('is_admin'):
+            bump_membership_version(conn,
+                                    [record['conversation'].recordID.key])
+
+    @skygear.after_delete("user_conversation", async=False)
+    def user_conversation_after_delete_handler(record, conn):
+        bump_membership_version(conn, [record['conversation'].recordID.key])
+
+
 def register_user_conversation_lambdas(settings):
     @skygear.op("chat:total_unread", auth_required=True, user_required=True)
     def total_unread_lambda():
@@ -1,41 +1,97 @@
+import threading
+
 from psycopg2.extensions import AsIs
 from strict_rfc3339 import timestamp_to_rfc3339_utcoffset
 
 from skygear.container import SkygearContainer
 from skygear.options import options as skyoptions
+from skygear.settings import settings
 from skygear.utils import db
 from skygear.utils.context import current_context, current_user_id
 
+from .cache import LRUCache
+from .transport import get_container_transport
+
+REQUEST_CACHE_KEY = '_chat_request_cache'
+_user_channel_cache = None
+_user_channel_cache_lock = threading.Lock()
+
+
+def _request_cache():
+    """
+    Return a dict for caching objects within the current request, or None
+    outside of a request context.
+    """
+    context = current_context()
+    if not context:
+        return None
+    return context.setdefault(REQUEST_CACHE_KEY, {})
+
 
 def _get_container():
-    return SkygearContainer(api_key=skyoptions.masterkey,
-                            user_id=current_user_id())
+    cache = _request_cache()
+    key = ('container', current_user_id())
+    if cache is not None and key in cache:
+        return cache[key]
+    container = SkygearContainer(api_key=skyoptions.masterkey,
+                                 user_id=current_user_id(),
+                                 transport=get_container_transport())
+    if cache is not None:
+        cache[key] = container
+    return container
 
 
 def _get_schema_name():
     return "app_%s" % skyoptions.appname
 
 
-def _get_channels_by_user_ids(user_ids):
-    # TODO: use database.query instead of raw SQL
-    with db.conn() as conn:
-        cur = conn.execute('''
-            SELECT name
-            FROM %(schema_name)s.user_channel
-            WHERE _owner_id in %(user_ids)s
-            LIMIT %(len)s;
-            ''', {
-            'schema_name': AsIs(_get_schema_name()),
-            'user_ids': tuple(user_ids),
-            'len': len(user_ids),
-        }
-        )
+def get_user_channel_cache():
+    global _user_channel_cache
+    with _user_channel_cache_lock:
+        if _user_channel_cache is None:
+            _user_channel_cache = LRUCache(
+                maxsize=settings.chat.user_channel_cache_size,
+                ttl=settings.chat.user_channel_cache_ttl)
+    return _user_channel_cache
 
-        results = []
-        for row in cur:
-            results.append(row[0])
 
-        return results
+def invalidate_user_channels(user_ids):
+    get_user_channel_cache().delete_many(user_ids)
+
+
+def _get_channels_by_user_ids(user_ids):
+    """
+    Return the user channel names of the given users.
+
+    Channel names are cached per user id; only the users missing from the
+    cache are looked up from the database.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    cache = get_user_channel_cache()
+    channels = cache.get_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in channels]
+    if missing:
+        fetched = {user_id: [] for user_id in missing}
+        # TODO: use database.query instead of raw SQL
+        with db.conn() as conn:
+            cur = conn.execute('''
+                SELECT _owner_id, name
+                FROM %(schema_name)s.user_channel
+                WHERE _owner_id in %(user_ids)s;
+                ''', {
+                'schema_name': AsIs(_get_schema_name()),
+                'user_ids': tuple(missing),
+            }
+            )
+            for row in cur:
+                fetched[row[0]].append(row[1])
+        cache.set_many(fetched)
+        channels.update(fetched)
+
+    results = []
+    for user_id in user_ids:
+        results += channels[user_id]
+    return results
 
 
 def _check_if_table_exists(tablename):